@@ -5,90 +5,77 @@ Created on Fri Mar 22 12:59:32 2024
 @author: vbrus
 """
 
-import pandas as pd
-from datetime import datetime
-import progressbar as pb
-import re
-import os
-from os import listdir
-from os.path import isfile, join
-from yaml import safe_load
-import time
-import sqlite3
-from sqlite3 import OperationalError
-        
-from functools import partial
-import numpy as np
-
-import pandas as pd
-import re
-import matplotlib
-import matplotlib.font_manager
-import matplotlib.pyplot as plt
-import numpy as np
 import math
-import matplotlib.dates as mdates
-from matplotlib.ticker import MaxNLocator
-import matplotlib.ticker as mtick
+import os
 
-plt.style.use("default")
-matplotlib.rcParams['font.family'] = ['DengXian']
-matplotlib.rcParams['figure.figsize'] = [8, 10]
+from publication_lag import LagStore
 
 files = [".//Date datasets//State Council.xlsx", ".//Date datasets//Hainan Provincial Government.xlsx", 
          ".//Date datasets//Shanghai Municipal Government.xlsx", ".//Date datasets//Sichuan Provincial Government.xlsx", 
          ".//Date datasets//Henan Provincial Government.xlsx", ".//Date datasets//Guangdong Provincial Government.xlsx",
          ".//Date datasets//Yunnan Provincial Government.xlsx"]
-num_rows = math.ceil(len(files)/2)
-fig, axs = plt.subplots(num_rows, 2)
-fig.tight_layout(pad=3.0)
-fig.supxlabel("Original issuing date of document")
-fig.supylabel("Mean days from issuance until publication")
-
-for i in range(len(files)):
-    doc = files[i]
-    data = pd.read_excel(doc)
-    
-    data['iss']= pd.to_datetime(data['iss'])
-    data['pub']= pd.to_datetime(data['pub'])
-    data["diff"] = data['pub'] - data['iss']
-    data['year'] = data['iss'].dt.year
-    #data.to_excel(doc, index=False)
-    data.set_index("year", inplace=True)
-    #print(len(data))
-    
-    
-    data.dropna(subset=['diff'], inplace=True)
-    data['diff'] = data["diff"].dt.days.astype(int)
-    data = data[['diff']]
-    data = data.loc[data['diff'] >= 0]
-    #print(data)
-        
-    data_grouped = data.groupby("year").mean()
-    data_grouped = data_grouped.loc[data_grouped.index >= 2008]
-    data_grouped = data_grouped.loc[data_grouped.index <= 2022]
-    #print(data_grouped)
-    
-    if i % 2 == 0:
-        column_no = 0
-    else:
-        column_no = 1
-        
-    row_no = math.floor(i/2)
-
-    axs[row_no, column_no].plot(data_grouped)
-    #axs[row_no, column_no].plot(result)
-    #axs.plot(data_grouped)
-    
-    try:
-        axs[row_no, column_no].set_title(data["database"][0])
-    except:
-        axs[row_no, column_no].set_title(doc[18:-5])
-    #axs[row_no, column_no].set_yscale('log')
-    axs[row_no, column_no].grid(linestyle="dashed")
-    axs[row_no, column_no].xaxis.set_major_locator(MaxNLocator(integer=True))
-
-plt.savefig('Fig_5.png', dpi=600)
-        
-        
-        
\ No newline at end of file
+
+
+def plot(stats, databases, years=(2008, 2022)):
+    """
+    Plots the mean publication lag per year for each database
+
+    Parameters
+    ----------
+    stats : Pandas DataFrame
+        Saved statistics, see LagStore.statistics().
+    databases : List
+        Databases to plot, one subplot each.
+    years : Tuple
+        First and last issuing year to plot.
+
+    """
+    # matplotlib is only imported once the statistics are there to plot
+    import matplotlib
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import MaxNLocator
+
+    plt.style.use("default")
+    matplotlib.rcParams['font.family'] = ['DengXian']
+    matplotlib.rcParams['figure.figsize'] = [8, 10]
+
+    num_rows = math.ceil(len(databases)/2)
+    fig, axs = plt.subplots(num_rows, 2)
+    fig.tight_layout(pad=3.0)
+    fig.supxlabel("Original issuing date of document")
+    fig.supylabel("Mean days from issuance until publication")
+
+    for i in range(len(databases)):
+        data = stats.loc[stats["database"] == databases[i]].set_index("year")
+        data_grouped = data.loc[(data.index >= years[0]) & (data.index <= years[1]), "mean"]
+
+        if i % 2 == 0:
+            column_no = 0
+        else:
+            column_no = 1
+
+        row_no = math.floor(i/2)
+
+        axs[row_no, column_no].plot(data_grouped)
+        axs[row_no, column_no].set_title(databases[i])
+        axs[row_no, column_no].grid(linestyle="dashed")
+        axs[row_no, column_no].xaxis.set_major_locator(MaxNLocator(integer=True))
+    return fig
+
+
+def main():
+    """
+    Updates the publication lag statistics and saves the plot to "Fig_5.png"
+    """
+    # only recomputes the files that are new or have changed since the last run
+    with LagStore() as store:
+        updated = store.update(files)
+        print(f"recomputed: {updated}")
+        stats = store.statistics()
+
+    fig = plot(stats, [os.path.splitext(os.path.basename(doc))[0] for doc in files])
+    fig.savefig('Fig_5.png', dpi=600)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""
+Builds the figures of the paper (Fig_1 to Fig_5). Every figure is listed in figures with the
+files it is made from and how it is saved. A figure is only rendered again when one of its
+input files, this file or its save parameters have changed since it was last built, or when
+its output is missing. Stale figures are rendered in parallel worker processes (see
+scheduler.py) with the non-interactive Agg backend. The notebooks use the plot functions
+below, so a figure looks the same whether it is built here or from its notebook.
+
+Run from this folder, e.g. "python build_figures.py" or "python build_figures.py Fig_3 Fig_4".
+"""
+
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.ticker as mtick
+from matplotlib.ticker import MaxNLocator
+
+# the Excel cache and the scheduler live with the data gathering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data gathering & processing"))
+from excel_cache import file_hash, read_excel
+import scheduler
+import Fig_5
+
+# set this to the max # of processor cores your system can dedicate to this task
+num_processes = 5
+# the input hashes of the figures as they were last built are saved here
+state_path = ".figures_state.json"
+# folder with the document number datasets of Fig_1 and Fig_2
+doc_numbers_folder = "Document number datasets"
+# files of Fig_2 and their provincial markers
+fig_2_files = ["Chongqing Municipal Government.xlsx", "Liaoning Provincial Government_sql.xlsx",
+               "Shanxi Provincial Government.xlsx", "Ningxia Provincial Government.xlsx",
+               "Yunnan Provincial Government_sql.xlsx", "Sichuan Provincial Government_sql.xlsx",
+               "Guangdong Provincial Government_sql.xlsx", "Shanghai Municipal Government_sql.xlsx",
+               "Henan Provincial Government_sql.xlsx", "Hubei Provincial Government_sql.xlsx"]
+prov_markers = ["渝", "辽", "晋", "宁", "云", "川", "粤", "沪", "豫", "鄂"]
+linestyles = ['solid', 'dotted', 'dashed', 'dashdot']
+# how the figures of the paper are saved
+tiff = {"dpi": 1200, "format": "tiff", "pil_kwargs": {"compression": "tiff_lzw"}}
+
+
+def style(figsize=None):
+    """
+    matplotlib figure styling shared by the figures
+    """
+    plt.style.use("default")
+    matplotlib.rcParams['font.family'] = ['DengXian']
+    if figsize:
+        matplotlib.rcParams['figure.figsize'] = figsize
+
+
+def type_order(doc_type):
+    """
+    Sorts document types as 发, 办发, 函, 办函
+    """
+    if doc_type.endswith("发"):
+        return 1 if "办" in doc_type else 0
+    return 3 if "办" in doc_type else 2
+
+
+def plot_fig_1(rates):
+    """
+    Plots the % of State Council documents released per year and document type
+
+    Parameters
+    ----------
+    rates : Pandas DataFrame
+        Release rates per year (rows) for 国发, 国办发, 国函 and 国办函 (columns), see
+        doc_numbers.release_rates.
+
+    """
+    style([8, 5])
+    rates = rates[sorted(rates.columns, key=type_order)]
+    rates.columns = ["guofa", "guobanfa", "guohan", "guobanhan"]
+    fig, axs = plt.subplots()
+    fig.supxlabel("Year")
+    fig.supylabel("Percentage of policy documents released to public")
+    axs.plot(rates, color='black')
+    axs.set_ylim([0, 100])
+    axs.grid(linestyle="dashed")
+    axs.yaxis.set_major_formatter(mtick.PercentFormatter())
+    axs.xaxis.set_major_locator(MaxNLocator(integer=True))
+    for line, ls in zip(axs.get_lines(), linestyles):
+        line.set_linestyle(ls)
+    axs.legend(loc='upper left', labels=rates.columns, fontsize="12")
+    return fig
+
+
+def plot_fig_2(rates):
+    """
+    Plots the % of documents released per year and document type for each province
+
+    Parameters
+    ----------
+    rates : Dict
+        Release rates (as in plot_fig_1) per subplot title.
+
+    """
+    style([9, 12])
+    num_rows = math.ceil(len(rates)/2)
+    fig, axs = plt.subplots(num_rows, 2)
+    fig.tight_layout(pad=3.5)
+    fig.supxlabel("Year")
+    fig.supylabel("Percentage of policy documents released to public")
+
+    for i, (title, df) in enumerate(rates.items()):
+        ax = axs[math.floor(i/2), i % 2]
+        df = df[sorted(df.columns, key=type_order)]
+        ax.plot(df, color='black')
+        for line, ls in zip(ax.get_lines(), linestyles):
+            line.set_linestyle(ls)
+        ax.set_title(title)
+        ax.legend(loc='upper left', labels=df.columns)
+        ax.set_ylim([0, 100])
+        ax.grid(linestyle="dashed")
+        ax.yaxis.set_major_formatter(mtick.PercentFormatter())
+        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    return fig
+
+
+def plot_fig_3(rates):
+    """
+    Plots the transparency rate per year for each topic
+
+    Parameters
+    ----------
+    rates : Pandas DataFrame
+        Transparency rate per year (rows) and topic (columns), see topics.transparency_rates.
+
+    """
+    style([8, 9])
+    num_rows = math.ceil(len(rates.columns)/2)
+    fig, axs = plt.subplots(num_rows, 2)
+    fig.tight_layout(pad=3.5)
+    fig.supxlabel("Year")
+    fig.supylabel("Transparency rate")
+
+    for i, key in enumerate(rates.columns):
+        ax = axs[math.floor(i/2), i % 2]
+        ax.plot(rates[[key]], color='black')
+        ax.set_ylim([25, 50])
+        ax.yaxis.set_major_formatter(mtick.PercentFormatter())
+        ax.set_title(key)
+        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+        ax.grid(linestyle="dashed")
+    return fig
+
+
+def plot_fig_4(grouped):
+    """
+    Plots the share of each result of the deletion check
+
+    Parameters
+    ----------
+    grouped : Pandas Series
+        Number of links per result (document available / removed / unavailable due to
+        website update / webpage unavailable), see deletion_results.classify.
+
+    """
+    fig, axs = plt.subplots()
+    axs.pie(grouped,
+            labels=["document available", "document removed",
+                    "document unavailable\n due to website update", "website\n unavailable"],
+            autopct='%1.1f%%',
+            colors=['white', 'white', 'white', 'white'],
+            hatch=['.', '|', '+', '-'],
+            wedgeprops={'linewidth': 1, 'edgecolor': 'black'},
+            pctdistance=1.2, labeldistance=1.4)
+    return fig
+
+
+def fig_1():
+    from doc_numbers import parse_doc_numbers, coverage, release_rates
+
+    data = read_excel(os.path.join(doc_numbers_folder, "State Council.xlsx"))
+    parsed = parse_doc_numbers(data["document_number_parsed"])
+    # a document counts as released if we have a fulltext (a link)
+    groups = coverage(parsed, released=data["url"].notna())
+    return plot_fig_1(release_rates(groups, pattern="国办?[发函]$"))
+
+
+def fig_2_rates():
+    """
+    Returns the release rates of the provinces of Fig_2, per subplot title
+    """
+    from doc_numbers import load_doc_numbers, coverage, release_rates
+
+    parsed = load_doc_numbers([os.path.join(doc_numbers_folder, file) for file in fig_2_files])
+    groups = coverage(parsed, keys=("file", "d_t", "d_y"))
+    rates = {}
+    for file, marker in zip(fig_2_files, prov_markers):
+        # only plot entries for which we have > n documents
+        rates[file.split(".")[0].split("_")[0]] = release_rates(
+            groups.loc[file.split(".")[0]], pattern=f"^{marker}[政府]?办?[发函]?$", min_found=25)
+    return rates
+
+
+def fig_2():
+    return plot_fig_2(fig_2_rates())
+
+
+def fig_3():
+    from topics import keyword_dictionaries, transparency_rates
+
+    df = read_excel("Dataset for Table_1_2, Fig_4.xlsx")
+    return plot_fig_3(transparency_rates(df, keyword_dictionaries, range(2008, 2022)))
+
+
+def fig_4():
+    from deletion_results import classify
+
+    results = read_excel("Dataset for Fig_4.xlsx")
+    r = results[["Link"]].assign(result=classify(results))
+    return plot_fig_4(r.groupby("result")["Link"].count())
+
+
+def fig_5():
+    from publication_lag import LagStore
+
+    # only recomputes the date datasets that are new or have changed since the last run
+    with LagStore() as store:
+        store.update(Fig_5.files)
+        stats = store.statistics()
+    return Fig_5.plot(stats, [os.path.splitext(os.path.basename(doc))[0] for doc in Fig_5.files])
+
+
+# the figures: how each is made, the files it is made from, where and how it is saved
+figures = {
+    "Fig_1": {"build": fig_1, "inputs": [os.path.join(doc_numbers_folder, "State Council.xlsx"), "doc_numbers.py"],
+              "output": "Fig_1.tiff", "save": tiff},
+    "Fig_2": {"build": fig_2, "inputs": [os.path.join(doc_numbers_folder, file) for file in fig_2_files] + ["doc_numbers.py"],
+              "output": "Fig_2.tiff", "save": tiff},
+    "Fig_3": {"build": fig_3, "inputs": ["Dataset for Table_1_2, Fig_4.xlsx", "topics.py"],
+              "output": "Fig_3.tiff", "save": tiff},
+    "Fig_4": {"build": fig_4, "inputs": ["Dataset for Fig_4.xlsx", "deletion_results.py"],
+              "output": "Fig_4.tiff", "save": tiff},
+    "Fig_5": {"build": fig_5, "inputs": [os.path.normpath(file) for file in Fig_5.files] + ["Fig_5.py", "publication_lag.py"],
+              "output": "Fig_5.png", "save": {"dpi": 600}},
+}
+
+
+def init_worker():
+    # render to files only, also where a display is available
+    matplotlib.use("Agg")
+
+
+def render_batch(names):
+    """
+    Renders and saves figures
+
+    Returns
+    -------
+    seconds : List
+        Time each figure took.
+
+    """
+    seconds = []
+    for name in names:
+        start = time.perf_counter()
+        fig = figures[name]["build"]()
+        fig.savefig(figures[name]["output"], **figures[name]["save"])
+        plt.close(fig)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+class BuildState():
+    def __init__(self, path=state_path):
+        """
+        Input hashes of the figures as they were last built. File hashes are kept per path
+        and mtime, so unchanged inputs are not hashed again.
+
+        """
+        self.path = path
+        try:
+            with open(path, encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            state = {}
+        self.files = state.get("files", {})
+        self.built = state.get("figures", {})
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        entry = self.files.get(path)
+        if not entry or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            entry = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": file_hash(path)}
+            self.files[path] = entry
+        return entry["hash"]
+
+    def key(self, name):
+        """
+        Hashes the inputs, the save parameters and the plotting code of a figure
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for path in figures[name]["inputs"] + [os.path.basename(__file__)]:
+            digest.update(f"{path}\0{self.file_hash(path)}\0".encode("utf-8"))
+        digest.update(json.dumps(figures[name]["save"], sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def save(self):
+        temp_path = self.path + f".{os.getpid()}"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"files": self.files, "figures": self.built}, file, indent=1)
+        os.replace(temp_path, self.path)
+
+
+def build(names=None, force=False, num_processes=num_processes):
+    """
+    Renders the figures whose inputs have changed since they were last built
+
+    Parameters
+    ----------
+    names : List or NoneType
+        Figures to build, defaults to all figures.
+    force : Bool
+        Render the figures even if they are up to date.
+    num_processes : Int
+        Number of processes to render in.
+
+    Returns
+    -------
+    status : Dict
+        Per figure: "rendered", "up to date" or "missing inputs".
+
+    """
+    names = list(names or figures)
+    state = BuildState()
+    status = {}
+    keys = {}
+    for name in names:
+        missing = [path for path in figures[name]["inputs"] if not os.path.exists(path)]
+        if missing:
+            print(f"{name}: missing {', '.join(missing)}")
+            status[name] = "missing inputs"
+            continue
+        keys[name] = state.key(name)
+        if not force and state.built.get(name) == keys[name] and os.path.exists(figures[name]["output"]):
+            status[name] = "up to date"
+        else:
+            status[name] = "stale"
+    stale = [name for name in names if status[name] == "stale"]
+
+    if len(stale) > 1 and num_processes > 1:
+        seconds = scheduler.run(render_batch, stale, min(num_processes, len(stale)), 1, init_worker,
+                                stage="figures")
+    else:
+        init_worker()
+        seconds = render_batch(stale)
+    for name, took in zip(stale, seconds):
+        print(f"{name}: rendered in {took:.1f} s")
+        state.built[name] = keys[name]
+        status[name] = "rendered"
+    state.save()
+    return status
+
+
+if __name__ == "__main__":
+    build(sys.argv[1:] or None)
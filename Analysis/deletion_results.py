@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Classification of the CheckDeletion.py results for Fig_4.ipynb. A 404 counts as "document
+unavailable due to website update" if more than half of the results of its database are a
+404, else as "document removed". The whole results table is classified at once, and large
+result files (e.g. checked_round_2.xlsx of a full-corpus check) can be streamed in chunks.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# the Excel cache lives with the data gathering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data gathering & processing"))
+from excel_cache import iter_chunks
+
+# share of 404 results above which the 404s of a database are put down to a website update
+update_threshold = 0.5
+# number of rows per chunk when streaming a result file
+chunk_size = 100000
+labels = ["document available", "document removed", "document unavailable due to website update",
+          "webpage unavailable"]
+
+
+def classify(results, shares=None, threshold=update_threshold):
+    """
+    Classifies every result
+
+    Parameters
+    ----------
+    results : Pandas DataFrame
+        Results with the columns Database and result (as written by CheckDeletion.py).
+    shares : Pandas Series or NoneType
+        Share of 404 results per database. If None, the shares are computed from results
+        itself, which then has to hold all results of each database.
+    threshold : Float
+        Share of 404 results above which a database counts as updated.
+
+    Returns
+    -------
+    classified : Pandas Series
+        One label per result, same index as results.
+
+    """
+    result = results["result"].astype(str)
+    is_404 = (result == "404").to_numpy()
+    if shares is None:
+        share = pd.Series(is_404, index=results.index).groupby(results["Database"], dropna=False).transform("mean")
+    else:
+        share = results["Database"].map(shares)
+    updated = (share > threshold).to_numpy()
+    classified = np.select([is_404 & updated, is_404, (result == "webpage unavailable").to_numpy()],
+                           [labels[2], labels[1], labels[3]], default=labels[0])
+    return pd.Series(classified, index=results.index, name="result")
+
+
+def database_shares(path, size=chunk_size):
+    """
+    Share of 404 results per database, counted over all chunks of a result file
+    """
+    totals = None
+    for chunk in iter_chunks(path, size):
+        is_404 = (chunk["result"].astype(str) == "404").rename("404")
+        counts = is_404.groupby(chunk["Database"], dropna=False).agg(["size", "sum"])
+        totals = counts if totals is None else totals.add(counts, fill_value=0)
+    if totals is None:
+        return pd.Series(dtype=float)
+    return totals["sum"] / totals["size"]
+
+
+def iter_classified(path, size=chunk_size, threshold=update_threshold):
+    """
+    Classifies a result file chunk by chunk. The file is read twice: once to count the 404s
+    per database, once to classify.
+
+    Parameters
+    ----------
+    path : Str
+        .xlsx or .csv file with the columns Database and result.
+    size : Int
+        Number of rows per chunk.
+    threshold : Float
+        Share of 404 results above which a database counts as updated.
+
+    Yields
+    ------
+    chunk : Pandas DataFrame
+        Next rows of the file, with the column result replaced by its label.
+
+    """
+    shares = database_shares(path, size)
+    for chunk in iter_chunks(path, size):
+        chunk["result"] = classify(chunk, shares, threshold)
+        yield chunk
+
+
+def count_labels(path, size=chunk_size, threshold=update_threshold):
+    """
+    Number of results per label in a result file, streamed in chunks
+
+    Returns
+    -------
+    counts : Pandas Series
+        Number of results per label (in order as labels).
+
+    """
+    counts = pd.Series(0, index=labels)
+    for chunk in iter_classified(path, size, threshold):
+        counts = counts.add(chunk["result"].value_counts(), fill_value=0)
+    return counts.astype(int)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Document number parsing and German tank estimates for Fig_1_2.ipynb. Whole columns of raw
+document numbers (e.g. 国办发〔2015〕12号) are parsed at once, and the number of documents
+issued per document type and year is estimated with a single groupby, instead of parsing
+row by row and filling in every missing number per type and year.
+"""
+
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+# the Excel cache lives with the data gathering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data gathering & processing"))
+from excel_cache import read_excel
+
+# columns that hold the raw document numbers, first one found in a file is used
+number_columns = ["document_number_parsed", "doc_number"]
+# removes spaces and unifies bracket types
+clean_table = str.maketrans({" ": None, "(": "〔", "[": "〔", "（": "〔", ")": "〕", "]": "〕", "）": "〕"})
+# standard format: type〔year〕number号
+doc_number_pattern = re.compile("([\u4e00-\u9FFF]{2,8})〔([12][90]\\d{2})〕(\\d{1,4})号")
+
+
+def parse_doc_numbers(doc_numbers, show_errors=False):
+    """
+    Takes in a column of raw document numbers and cleans them to a uniform format
+
+    Parameters
+    ----------
+    doc_numbers : Pandas Series or List
+        Raw document numbers to parse.
+    show_errors : bool
+        Whether to print the document numbers that could not be parsed.
+
+    Returns
+    -------
+    parsed : Pandas DataFrame
+        Same index as doc_numbers, with the columns d_t (type of the document number, e.g.
+        国发 or 国办函), d_y (year) and d_n (number). All three are missing if the document
+        number could not be parsed.
+
+    """
+    doc_numbers = pd.Series(doc_numbers, dtype=object)
+    cleaned = doc_numbers.astype(str).str.translate(clean_table)
+    parts = cleaned.str.extract(doc_number_pattern)
+    found = parts[0].notna()
+
+    parsed = pd.DataFrame(index=doc_numbers.index)
+    parsed["d_t"] = parts[0].astype(object).where(found, None)
+    # astype(int) instead of to_numeric, as \d also matches full-width digits
+    for column, part in (("d_y", 1), ("d_n", 2)):
+        values = pd.Series(pd.NA, index=doc_numbers.index, dtype="Int64")
+        values[found] = parts.loc[found, part].astype(object).astype("int64")
+        parsed[column] = values
+
+    if show_errors:
+        # print any parsing errors
+        for doc_number in cleaned[~found & doc_numbers.notna()]:
+            print(doc_number)
+    return parsed
+
+
+def load_doc_numbers(paths):
+    """
+    Loads and parses several document number datasets in one batch
+
+    Parameters
+    ----------
+    paths : List
+        Paths of the Excel files, e.g. all files in "Document number datasets".
+
+    Returns
+    -------
+    parsed : Pandas DataFrame
+        One row per document with the columns file (name of the file without extension),
+        url, d_t, d_y and d_n.
+
+    """
+    frames = []
+    for path in paths:
+        data = read_excel(path)
+        column = [column for column in number_columns if column in data.columns][0]
+        frames.append(pd.DataFrame({"file": os.path.splitext(os.path.basename(path))[0],
+                                    "url": data["url"], "doc_number": data[column]}))
+    data = pd.concat(frames, ignore_index=True)
+    return pd.concat([data[["file", "url"]], parse_doc_numbers(data["doc_number"])], axis=1)
+
+
+def german_tank_estimates(parsed, keys=("d_t", "d_y")):
+    """
+    Estimates the number of documents per document type and year from the highest document
+    number found and the number of documents found (German tank problem)
+
+    Parameters
+    ----------
+    parsed : Pandas DataFrame
+        Output of parse_doc_numbers or load_doc_numbers.
+    keys : Tuple
+        Columns to group by, add "file" to estimate several files at once.
+
+    Returns
+    -------
+    estimates : Pandas DataFrame
+        Per group (in order of first appearance): observed (number of documents found),
+        max (highest document number found) and estimate (rounded estimate).
+
+    """
+    estimates = parsed.dropna(subset=["d_t"]).groupby(list(keys), sort=False)["d_n"].agg(
+        observed="size", max="max")
+    max_value = estimates["max"].astype(float)
+    # np.round rounds halves to even, as round() did
+    estimates["estimate"] = np.round(max_value + max_value / estimates["observed"] - 1).astype("int64")
+    return estimates
+
+
+def coverage(parsed, released=None, keys=("d_t", "d_y")):
+    """
+    Counts per document type and year how many of the estimated documents were found
+
+    The estimated documents of a group are numbered 1 up to (not including) its estimate;
+    documents found outside that range are left out, as are duplicate numbers counted once
+    per copy, as when the missing numbers were filled in one by one.
+
+    Parameters
+    ----------
+    parsed : Pandas DataFrame
+        Output of parse_doc_numbers or load_doc_numbers.
+    released : Pandas Series or NoneType
+        Boolean per document of parsed, whether its fulltext was released (e.g. it has a url).
+        If None, every document found counts as released.
+    keys : Tuple
+        Columns to group by, add "file" to count several files at once.
+
+    Returns
+    -------
+    groups : Pandas DataFrame
+        The estimates per group with the columns found (documents found in range), documents
+        (estimated documents plus duplicates) and unreleased (documents not found or not
+        released).
+
+    """
+    keys = list(keys)
+    estimates = german_tank_estimates(parsed, keys)
+    data = parsed.dropna(subset=["d_t"])
+    data = data.assign(released=True if released is None else released[data.index].astype(bool))
+    data = data.join(estimates["estimate"], on=keys)
+    in_range = data.loc[(data["d_n"] >= 1) & (data["d_n"] < data["estimate"])]
+    found = in_range.groupby(keys, sort=False).agg(found=("d_n", "size"), numbers=("d_n", "nunique"),
+                                                   released=("released", "sum"))
+    groups = estimates.join(found).fillna({"found": 0, "numbers": 0, "released": 0})
+    groups["documents"] = (groups["estimate"] - 1).clip(lower=0) - groups["numbers"] + groups["found"]
+    groups["unreleased"] = groups["documents"] - groups["released"]
+    return groups.drop(columns=["numbers", "released"]).astype({"found": "int64", "documents": "int64",
+                                                               "unreleased": "int64"})
+
+
+def release_rates(groups, years=range(2008, 2023), pattern=None, min_found=None):
+    """
+    Percentage of documents released per year, with one column per document type
+
+    Parameters
+    ----------
+    groups : Pandas DataFrame
+        Output of coverage for a single file.
+    years : Iterable
+        Years to report, years without documents are 0.
+    pattern : Str or NoneType
+        Regex, only document types that match it are reported.
+    min_found : Int or NoneType
+        Only document types with more than min_found documents found are reported.
+
+    Returns
+    -------
+    rates : Pandas DataFrame
+        Index years, columns document types (in order of first appearance).
+
+    """
+    per_type = groups.groupby(level="d_t", sort=False)[["documents", "found"]].sum()
+    types = per_type.index[per_type["documents"] > 0]
+    if pattern is not None:
+        types = [d_t for d_t in types if re.search(pattern, d_t)]
+    if min_found is not None:
+        types = [d_t for d_t in types if per_type.loc[d_t, "found"] > min_found]
+
+    documents = groups["documents"]
+    pct = (1 - groups["unreleased"] / documents.where(documents > 0)) * 100
+    pct = pct.fillna(0).droplevel([level for level in groups.index.names if level not in ("d_t", "d_y")])
+    rates = pct.unstack("d_t").reindex(index=list(years), columns=list(types)).fillna(0)
+    rates.index.name = None
+    rates.columns.name = None
+    return rates
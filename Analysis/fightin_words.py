@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Title segmentation and the Fightin' Words comparison (Bayesian log-odds with an informative
+Dirichlet prior) for Table_1_2.ipynb. Segmented titles are kept in a SQLite cache keyed by
+the title text, so a rerun or a new set of titles only segments the titles it has not seen.
+The comparison works on the sparse count matrix and computes all z-scores at once.
+"""
+
+import re
+import sqlite3
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer as CV
+
+# segmented titles are saved here
+cache_path = "segmentation_cache.sqlite"
+# number of titles looked up or saved per query, so memory use does not grow with the cache
+chunk_size = 500
+
+
+def strip_text(text):
+    """
+    strips a Chinese text to only the desired features
+
+    args:
+        text: list of strings to clean
+
+    returns:
+        text: list of strings that have been cleaned
+
+    """
+    # jieba takes about half a second to import, so it is only loaded when a title is not in the cache
+    from jieba import posseg as pseg
+    sentence = [re.sub ("\/", "_", str (item)) for item in pseg.cut(text)]
+    sentence = [word for word in sentence if not re.search ("_ns|_x|_m", word)] #exclude place names, non-morphemes, measures
+    sentence = [word for word in sentence if len (re.sub ("_.*", "", word))>1] #restrict to two-character words
+    sentence = [word for word in sentence if re.search ("_n|_v|_j", word)] #restrict to nouns, verbs, adjectives,
+    return ' '.join(list(re.sub ("_.*", "", word) for word in sentence))
+
+
+class SegmentationCache():
+    def __init__(self, path=cache_path):
+        """
+        Opens (or creates) the segmentation cache
+
+        Parameters
+        ----------
+        path : Str
+            Path of the SQLite file.
+
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS segments (title TEXT PRIMARY KEY, words TEXT)")
+        self.connection.commit()
+
+    def strip_titles(self, titles):
+        """
+        Runs strip_text over all titles, taking titles that were segmented before from the cache
+
+        Parameters
+        ----------
+        titles : List
+            Titles to segment.
+
+        Returns
+        -------
+        stripped : List
+            strip_text(title) for every title, in the same order.
+
+        """
+        titles = [str(title) for title in titles]
+        segments = {}
+        unique_titles = list(dict.fromkeys(titles))
+        for start in range(0, len(unique_titles), chunk_size):
+            chunk = unique_titles[start:start + chunk_size]
+            # look up the chunk
+            rows = self.connection.execute(
+                f"SELECT title, words FROM segments WHERE title IN ({','.join('?' * len(chunk))})", chunk)
+            segments.update(rows)
+            # segment what is new and save it
+            new = [(title, strip_text(title)) for title in chunk if title not in segments]
+            if new:
+                self.connection.executemany("INSERT OR REPLACE INTO segments VALUES (?, ?)", new)
+                self.connection.commit()
+                segments.update(new)
+        return [segments[title] for title in titles]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def bayes_compare_language(l1, l2, ngram = 1, prior=.01, cv = None):
+    '''
+    args:
+      l1, l2; a list of strings from each language sample
+      ngram; an int describing up to what n gram you want to consider (1 is unigrams,
+    2 is bigrams + unigrams, etc). Ignored if a custom CountVectorizer is passed.
+      prior; either a float describing a uniform prior, or a vector describing a prior
+    over vocabulary items. If you're using a predefined vocabulary, make sure to specify that
+    when you make your CountVectorizer object.
+      cv; a sklearn.feature_extraction.text.CountVectorizer object, if desired.
+
+    returns:
+      A list of length |Vocab| where each entry is a (n-gram, zscore) tuple.
+    '''
+
+    if cv is None and type(prior) is not float:
+        raise ValueError("If using a non-uniform prior, please also pass a count vectorizer "
+                         "with the vocabulary parameter set.")
+    if cv is None:
+        cv = CV(decode_error = 'ignore', min_df = 10, max_df = .5, ngram_range=(1,ngram),
+                binary = False,
+                max_features = 15000)
+    # sparse docs x vocab matrix, only the column sums per language are needed
+    counts_mat = cv.fit_transform(l1+l2).tocsr()
+    vocab_size = len(cv.vocabulary_)
+    print("Vocab size is {}".format(vocab_size))
+    if type(prior) is float:
+        priors = np.full(vocab_size, prior)
+    else:
+        priors = np.asarray(prior, dtype=float)
+    counts_1 = np.asarray(counts_mat[:len(l1)].sum(axis=0), dtype=float).ravel()
+    counts_2 = np.asarray(counts_mat[len(l1):].sum(axis=0), dtype=float).ravel()
+    a0 = np.sum(priors)
+    n1 = np.sum(counts_1)
+    n2 = np.sum(counts_2)
+    print("Comparing language...")
+    #compute delta
+    term1 = np.log((counts_1 + priors)/(n1 + a0 - counts_1 - priors))
+    term2 = np.log((counts_2 + priors)/(n2 + a0 - counts_2 - priors))
+    delta = term1 - term2
+    #compute variance on delta
+    var = 1./(counts_1 + priors) + 1./(counts_2 + priors)
+    z_scores = delta/np.sqrt(var)
+    index_to_term = cv.get_feature_names_out()
+    sorted_indices = np.argsort(z_scores)
+    return list(zip(index_to_term[sorted_indices].tolist(), z_scores[sorted_indices]))
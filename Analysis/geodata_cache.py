@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Province (adm1) boundaries for the geoblocking maps in "[NO LONGER USED] Fig_7_8_9.ipynb".
+The maps only colour whole provinces, so the full resolution adm2 shapefile is dissolved to
+provinces and simplified to what is visible at the size of the figures, once. The result is
+pickled in a .geodata_cache folder next to the shapefile, named after the hash of the
+shapefile, so a changed shapefile is simply prepared again on the next load. For the 33
+provinces a pickle loads in about a millisecond, GeoParquet took over 30 ms, more than
+reading the shapefile itself.
+"""
+
+import hashlib
+import os
+import re
+import sys
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+# the file hash of the Excel cache is used for the shapefiles as well
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data gathering & processing"))
+from excel_cache import file_hash
+
+# adm2 shapefile the provinces are made from
+source_path = os.path.join("geodata", "chn_admbnda_adm2_ocha_2020.shp")
+# folder (next to the shapefile) that holds the prepared provinces
+cache_dir = ".geodata_cache"
+# largest deviation (in degrees) of a simplified border, 0.01 degrees is about 1 km and
+# below one pixel of the 10 inch wide maps at 600 dpi
+tolerance = 0.01
+# provinces left out of the maps (Taiwan)
+excluded = ["CN071"]
+# columns kept per province
+columns = ["ADM1_PCODE", "ADM1_EN", "ADM1_ZH"]
+
+
+def source_hash(path=source_path):
+    """
+    Hashes the files of a shapefile that hold its geometries and attributes, together with
+    the versions of geopandas and shapely the pickles depend on
+    """
+    stem = os.path.splitext(path)[0]
+    digest = hashlib.blake2b(f"{gpd.__version__} {shapely.__version__}".encode("ascii"), digest_size=16)
+    for extension in [".shp", ".shx", ".dbf", ".prj"]:
+        if os.path.exists(stem + extension):
+            digest.update(file_hash(stem + extension).encode("ascii"))
+    return digest.hexdigest()
+
+
+def prepare(map_data, tolerance=tolerance):
+    """
+    Dissolves adm2 regions to provinces and simplifies their borders
+
+    Parameters
+    ----------
+    map_data : GeoPandas GeoDataFrame
+        adm2 regions, with the columns ADM1_PCODE, ADM1_EN and ADM1_ZH.
+    tolerance : Float
+        Largest deviation of a simplified border, in the units of the CRS.
+
+    Returns
+    -------
+    provinces : GeoPandas GeoDataFrame
+        One row per province, sorted by ADM1_PCODE.
+
+    """
+    map_data = map_data[~map_data["ADM1_PCODE"].isin(excluded)]
+    provinces = map_data[columns + ["geometry"]].dissolve(by="ADM1_PCODE", as_index=False, sort=True)
+    provinces = provinces[columns + ["geometry"]]
+    if hasattr(shapely, "coverage_simplify"):
+        # simplifies the borders shared by two provinces the same way, so no gaps open up
+        provinces["geometry"] = shapely.coverage_simplify(provinces.geometry.values, tolerance)
+    else:
+        provinces["geometry"] = provinces.geometry.simplify(tolerance, preserve_topology=True)
+    return provinces
+
+
+def load_provinces(path=source_path, tolerance=tolerance):
+    """
+    Loads the simplified provinces, preparing them from the shapefile if needed
+
+    Parameters
+    ----------
+    path : Str
+        adm2 shapefile.
+    tolerance : Float
+        Largest deviation of a simplified border, part of the cache key.
+
+    Returns
+    -------
+    provinces : GeoPandas GeoDataFrame
+        Columns ADM1_PCODE, ADM1_EN, ADM1_ZH and geometry, one row per province.
+
+    """
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), cache_dir)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(folder, f"{stem}-{source_hash(path)}-{tolerance:g}.pkl")
+    if os.path.exists(cache_path):
+        return pd.read_pickle(cache_path)
+
+    provinces = prepare(gpd.read_file(path), tolerance)
+    os.makedirs(folder, exist_ok=True)
+    temp_path = cache_path + f".{os.getpid()}"
+    provinces.to_pickle(temp_path)
+    os.replace(temp_path, cache_path)
+    # remove the provinces of earlier versions of the shapefile
+    earlier = re.compile(re.escape(stem) + r"-[0-9a-f]{32}-" + re.escape(f"{tolerance:g}") + r"\.pkl")
+    for name in os.listdir(folder):
+        if earlier.fullmatch(name) and os.path.join(folder, name) != cache_path:
+            os.remove(os.path.join(folder, name))
+    return provinces
+
+
+if __name__ == "__main__":
+    print(load_provinces())
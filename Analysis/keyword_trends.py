@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Keyword frequency per year over the document bodies of a policy corpus (as in Fig_0.ipynb).
+Each body is scanned once for all keywords, and the corpus is read and counted in chunks over
+multiple processes, so memory use does not depend on the size of the corpus. A corpus that is
+held in the bigram index (ngram_index.py) is counted from the index, which only reads the
+documents that can contain a keyword.
+"""
+
+import os
+import re
+import sys
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from topics import trie_pattern
+
+# the Excel cache, the bigram index and the scheduler live with the data gathering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data gathering & processing"))
+from excel_cache import iter_chunks
+from ngram_index import NgramIndex
+import scheduler
+
+# number of documents per chunk
+chunk_size = 2000
+
+
+class KeywordCounter():
+    def __init__(self, keywords):
+        """
+        Counts all keywords in a text in a single scan
+
+        Counts follow str.count, i.e. occurrences of the same keyword do not overlap. A
+        trie-shaped regex inside a lookahead finds the longest keyword at every position, and
+        each keyword also counts for the keywords that are its prefixes. Keywords that can
+        overlap themselves (e.g. 公开公开 in 公开公开公开) would be counted differently, so
+        those few are counted with str.count instead.
+
+        Parameters
+        ----------
+        keywords : List
+            Keywords to count.
+
+        """
+        self.keywords = list(keywords)
+        self.self_overlapping = [n for n, keyword in enumerate(self.keywords)
+                                 if any(keyword[i:] == keyword[:-i] for i in range(1, len(keyword)))]
+        scanned = [keyword for n, keyword in enumerate(self.keywords) if n not in self.self_overlapping]
+        self.pattern = re.compile("(?=(" + trie_pattern(scanned) + "))") if scanned else None
+        # per keyword found: which keywords occur at that position
+        self.occurrences = {}
+        for keyword in scanned:
+            occurs = np.zeros(len(self.keywords), dtype=np.int64)
+            for n, other in enumerate(self.keywords):
+                if n not in self.self_overlapping and keyword.startswith(other):
+                    occurs[n] = 1
+            self.occurrences[keyword] = occurs
+
+    def count(self, text):
+        """
+        Returns the number of times each keyword occurs in text, in order as keywords
+        """
+        counts = np.zeros(len(self.keywords), dtype=np.int64)
+        if self.pattern is not None:
+            for keyword, found in Counter(self.pattern.findall(text)).items():
+                counts += found * self.occurrences[keyword]
+        for n in self.self_overlapping:
+            counts[n] = text.count(self.keywords[n])
+        return counts
+
+
+# the KeywordCounter of this process
+counter = None
+
+
+def init_worker(keywords):
+    global counter
+    counter = KeywordCounter(keywords)
+
+
+def count_chunk(chunk):
+    """
+    Counts the keywords in a chunk of documents
+
+    Parameters
+    ----------
+    chunk : Pandas DataFrame
+        Documents with the columns Year and Body.
+
+    Returns
+    -------
+    counts : Pandas DataFrame
+        Per year (index): the number of documents and the number of mentions of each keyword.
+
+    """
+    counts = np.array([counter.count(str(text)) for text in chunk["Body"]], dtype=np.int64)
+    counts = counts.reshape(len(chunk), len(counter.keywords))
+    counts = pd.DataFrame(counts, columns=counter.keywords)
+    counts.insert(0, "documents", 1)
+    return counts.groupby(chunk["Year"].astype(int).to_numpy()).sum()
+
+
+def keyword_counts(chunks, keywords, num_processes=1):
+    """
+    Counts the keywords per year over a corpus, chunk by chunk
+
+    Parameters
+    ----------
+    chunks : Iterable
+        Chunks of documents (Pandas DataFrames with the columns Year and Body), e.g. from
+        iter_chunks.
+    keywords : List
+        Keywords to count.
+    num_processes : Int
+        Number of processes. With 1, everything is counted in this process.
+
+    Returns
+    -------
+    counts : Pandas DataFrame
+        Per year (index, sorted): the number of documents and the number of mentions of each
+        keyword.
+
+    """
+    if num_processes > 1:
+        results = scheduler.stream(count_chunk, chunks, num_processes, init_worker, (keywords,))
+    else:
+        init_worker(keywords)
+        results = (count_chunk(chunk) for chunk in chunks)
+
+    counts = pd.DataFrame(columns=["documents"] + list(keywords), dtype=np.int64)
+    for chunk_counts in results:
+        counts = counts.add(chunk_counts, fill_value=0)
+    return counts.astype(np.int64).sort_index()
+
+
+def indexed_keyword_counts(index, keywords):
+    """
+    Counts the keywords per year over the documents of a bigram index
+
+    Parameters
+    ----------
+    index : NgramIndex
+        Index over the corpus.
+    keywords : List
+        Keywords to count.
+
+    Returns
+    -------
+    counts : Pandas DataFrame
+        Per year (index, sorted): the number of documents and the number of mentions of each
+        keyword, as keyword_counts.
+
+    """
+    counts = index.documents_per_year().to_frame("documents")
+    for keyword in keywords:
+        found = index.count(keyword, field="body")
+        counts[keyword] = found["count"].groupby(found["Year"].astype(int)).sum()
+    return counts.fillna(0).astype(np.int64).sort_index()
+
+
+def keyword_trends(path, keywords, years=range(2008, 2023), num_processes=1, size=chunk_size):
+    """
+    Mean keyword mentions per document per year, streamed from a corpus file
+
+    Parameters
+    ----------
+    path : Str or NgramIndex
+        .xlsx or .csv file with the columns Year and Body, or a bigram index over the corpus.
+    keywords : List
+        Keywords to count.
+    years : Iterable
+        Years to report.
+    num_processes : Int
+        Number of processes (not used for an index).
+    size : Int
+        Number of documents per chunk (not used for an index).
+
+    Returns
+    -------
+    trends : Pandas DataFrame
+        Index years, one column per keyword.
+
+    """
+    if isinstance(path, NgramIndex):
+        counts = indexed_keyword_counts(path, keywords)
+    else:
+        counts = keyword_counts(iter_chunks(path, size), keywords, num_processes)
+    counts = counts.reindex(list(years))
+    return counts[list(keywords)].div(counts["documents"], axis=0)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Publication lag statistics for Fig_5.py. The lag (days from issuance until publication) is
+summarised per database and year and saved in a SQLite file. Updating the statistics only
+recomputes the databases whose file is new or has changed since it was last read, and the
+figure is drawn from the saved statistics.
+"""
+
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+# the Excel cache lives with the data gathering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data gathering & processing"))
+from excel_cache import read_excel, file_hash
+
+# statistics are saved here
+store_path = "publication_lag.sqlite"
+# percentiles saved next to the mean and the median
+percentiles = [0.25, 0.75, 0.9]
+statistics = ["count", "mean", "median"] + [f"p{round(q * 100)}" for q in percentiles]
+
+
+def lag_days(data):
+    """
+    Calculates the days from issuance until publication per document
+
+    Parameters
+    ----------
+    data : Pandas DataFrame
+        Dataset with the columns iss (issuing date) and pub (publishing date).
+
+    Returns
+    -------
+    diff : Pandas Series
+        Days until publication, with the issuing year as index. Documents without both dates
+        or published before they were issued are left out.
+
+    """
+    iss = pd.to_datetime(data["iss"])
+    pub = pd.to_datetime(data["pub"])
+    diff = pd.Series((pub - iss).to_numpy(), index=iss.dt.year.rename("year"), name="diff").dropna()
+    diff = diff.dt.days.astype(int)
+    return diff.loc[diff >= 0]
+
+
+def lag_statistics(data):
+    """
+    Summarises the publication lag per issuing year
+
+    Parameters
+    ----------
+    data : Pandas DataFrame
+        Dataset with the columns iss and pub.
+
+    Returns
+    -------
+    stats : Pandas DataFrame
+        Per year (index): count, mean, median and the percentiles, in days.
+
+    """
+    grouped = lag_days(data).groupby(level="year")
+    stats = grouped.agg(["count", "mean", "median"])
+    for q, name in zip(percentiles, statistics[3:]):
+        stats[name] = grouped.quantile(q)
+    stats.index = stats.index.astype(int)
+    return stats
+
+
+class LagStore():
+    def __init__(self, path=store_path):
+        """
+        Opens (or creates) the saved statistics
+
+        Parameters
+        ----------
+        path : Str
+            Path of the SQLite file.
+
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sources (database TEXT PRIMARY KEY, "
+                                "path TEXT, mtime INTEGER, size INTEGER, hash TEXT)")
+        columns = ", ".join(f"{name} REAL" for name in statistics)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS lag (database TEXT, year INTEGER, {columns}, "
+                                "PRIMARY KEY (database, year))")
+        self.connection.commit()
+
+    def update(self, files):
+        """
+        Recomputes the statistics of every file that is new or has changed
+
+        Parameters
+        ----------
+        files : List
+            Paths of the date datasets, the database is named after the file.
+
+        Returns
+        -------
+        updated : List
+            Databases that were recomputed.
+
+        """
+        updated = []
+        for path in files:
+            database = os.path.splitext(os.path.basename(path))[0]
+            stat = os.stat(path)
+            source = self.connection.execute("SELECT mtime, size, hash FROM sources WHERE database = ?",
+                                             (database,)).fetchone()
+            if source and source[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            content_hash = file_hash(path)
+            if not source or source[2] != content_hash:
+                stats = lag_statistics(read_excel(path))
+                rows = [(database, int(year), *[float(row[name]) for name in statistics])
+                        for year, row in stats.iterrows()]
+                self.connection.execute("DELETE FROM lag WHERE database = ?", (database,))
+                self.connection.executemany(
+                    f"INSERT INTO lag VALUES (?, ?, {', '.join('?' * len(statistics))})", rows)
+                updated.append(database)
+            self.connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)",
+                                    (database, path, stat.st_mtime_ns, stat.st_size, content_hash))
+            self.connection.commit()
+        return updated
+
+    def statistics(self, database=None):
+        """
+        Returns the saved statistics
+
+        Parameters
+        ----------
+        database : Str or NoneType
+            Only return this database, or all if None.
+
+        Returns
+        -------
+        stats : Pandas DataFrame
+            Columns database, year and the statistics.
+
+        """
+        query = "SELECT * FROM lag"
+        params = ()
+        if database is not None:
+            query += " WHERE database = ?"
+            params = (database,)
+        stats = pd.read_sql_query(query + " ORDER BY database, year", self.connection, params=params)
+        return stats.astype({"year": int, "count": int})
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
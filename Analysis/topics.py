@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Keyword topic classifier for Fig_3.ipynb. All keywords of all topics are matched against
+each title in a single scan, every title is tagged with its set of topics, and the
+transparency rate per topic and year follows from one groupby.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# keywords per topic, a title is about a topic if it contains any of its keywords
+keyword_dictionaries = {"Science & Technology": ["科技", "科学", "技术","高新"],
+                        "Environment": ["环保", "生态环境", "污染", "环境", "废物"],
+                        "Socio-economic policy": ["消费", "就业", "养老", "社会保障", "劳动","劳工","人力资源", "社保",
+                                                 "社会"],
+                        "Macro-economy & trade": ["经济，金融", "进口", "出口", "贸易", "价格", "商业", "外贸", "商务"],
+                        "Research & education": ["教育", "研究院", "研究所", "大学", "科研"],
+                        "Healthcare": ["医", "卫生", "药"],
+                        "Cadre management & discipline inspection": ["干部", "纪律", "检查", "党内", "党员"],
+                        "State-owned resources, projects & bidding": ["采购", "专项", "项目", "公共资源", "国有"],
+                        "International affairs": ["国际", "世界", "外国"],
+                        "Cyberspace & data": ["网络", "互联网", "数据", "上网", "网上", "信息"]
+                       }
+
+
+def trie_pattern(keywords):
+    """
+    Builds a regex that matches the longest of the keywords, shaped as a trie (e.g. 社会保障
+    and 社会 become 社会(?:保障)?), so that the regex engine branches on one character at a
+    time instead of trying every keyword at every position
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def to_pattern(node):
+        # longer continuations first, so the longest keyword wins
+        branches = [re.escape(char) + to_pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            pattern = "(?:" + pattern + ")?"
+        return pattern
+
+    return to_pattern(trie)
+
+
+class TopicMatcher():
+    def __init__(self, dictionaries=keyword_dictionaries):
+        """
+        Matches all keywords of all topics at once
+
+        The keywords are combined into one trie-shaped regex inside a lookahead, so that a
+        match is found at every position of a title, also where matches overlap (e.g. 外国有
+        contains both 外国 and 国有). The keyword found at a position is the longest one that
+        starts there; every shorter keyword that starts there is a prefix of it, so each
+        keyword also carries the topics of its prefixes.
+
+        Parameters
+        ----------
+        dictionaries : Dict
+            Topic -> list of keywords.
+
+        """
+        self.topics = list(dictionaries)
+        keywords = {keyword for values in dictionaries.values() for keyword in values}
+        self.pattern = re.compile("(?=(" + trie_pattern(keywords) + "))")
+        self.keyword_topics = {}
+        for keyword in keywords:
+            self.keyword_topics[keyword] = np.array(
+                [n for n, values in enumerate(dictionaries.values())
+                 if any(keyword.startswith(value) for value in values)])
+
+    def tag(self, titles):
+        """
+        Tags every title with its topics
+
+        Parameters
+        ----------
+        titles : Pandas Series
+            Titles to classify.
+
+        Returns
+        -------
+        tags : Pandas DataFrame
+            Same index as titles, one boolean column per topic.
+
+        """
+        titles = pd.Series(titles)
+        found = titles.astype(str).str.findall(self.pattern)
+        counts = found.str.len().to_numpy()
+        keywords = [keyword for matches in found for keyword in matches]
+        topic_lists = [self.keyword_topics[keyword] for keyword in keywords]
+
+        tags = np.zeros((len(titles), len(self.topics)), dtype=bool)
+        if topic_lists:
+            rows = np.repeat(np.repeat(np.arange(len(titles)), counts), [len(t) for t in topic_lists])
+            tags[rows, np.concatenate(topic_lists)] = True
+        return pd.DataFrame(tags, index=titles.index, columns=self.topics)
+
+
+def transparency_rates(df, dictionaries=keyword_dictionaries, years=range(2008, 2022)):
+    """
+    Calculates the % of documents for which the fulltext has been released, per topic and year
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        Cross-referenced dataset with the columns title, referral_date and
+        fulltext_released_to_public.
+    dictionaries : Dict
+        Topic -> list of keywords.
+    years : Iterable
+        Years to report.
+
+    Returns
+    -------
+    rates : Pandas DataFrame
+        Index years, one column per topic (in order as dictionaries).
+
+    """
+    tags = TopicMatcher(dictionaries).tag(df["title"])
+    released = (df["fulltext_released_to_public"] == True).to_numpy()
+    # clean dates to years
+    year = df["referral_date"].str[0:4].astype(int).rename("year")
+
+    # documents and released documents per topic, summed per year in one groupby
+    counts = pd.concat([tags, tags & released[:, None]], axis=1, keys=["documents", "released"])
+    per_year = counts.groupby(year).sum().reindex(list(years))
+    rates = per_year["released"] / per_year["documents"] * 100
+    rates.index.name = None
+    return rates
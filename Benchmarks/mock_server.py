@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP server that stands in for the government websites when benchmarking
+CheckDeletion.py. The answer for a document follows from its number in the url (/doc/<k>),
+so every run sees the same mix of available pages, PDF attachments, 404s, soft 404 pages and
+blocked requests. Available pages have an ETag and answer conditional requests with 304.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds every answer is delayed, as a stand-in for a slow website
+latency = 0.02
+# out of every 20 documents: one 404, one soft 404 page, one 403, one PDF, the rest available
+page_body = ("<html><head><title>政策文件</title></head><body><div class='content'>"
+             + "各地区、各部门要高度重视，切实加强组织领导，确保各项措施落到实处、取得实效。" * 200
+             + "</div></body></html>").encode("utf-8")
+soft_404_body = "<html><body>对不起，您访问的页面不存在或已被删除。</body></html>".encode("utf-8")
+pdf_body = b"%PDF-1.4\n" + b"0" * (2 << 20)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(latency)
+        try:
+            k = int(self.path.rstrip("/").rsplit("/", 1)[-1])
+        except ValueError:
+            k = 0
+        content_type = "text/html; charset=utf-8"
+        if k % 20 == 1:
+            status, body = 404, b"not found"
+        elif k % 20 == 2:
+            status, body = 200, soft_404_body
+        elif k % 20 == 3:
+            status, body = 403, b"forbidden"
+        elif k % 20 == 4:
+            status, body, content_type = 200, pdf_body, "application/pdf"
+        else:
+            status, body = 200, page_body
+        etag = f'"{k}"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status in [200, 304]:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            # the client has read as much of the body as it needed
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def expected(k):
+    """
+    Result CheckDeletion.py should find for document k
+    """
+    return {1: 404, 2: 404, 3: 403}.get(k % 20, 200)
+
+
+class MockServer():
+    def __init__(self):
+        """
+        Starts the server on a free port of localhost, in a background thread
+        """
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def links(self, n):
+        """
+        Returns the urls of documents 0 to n-1
+        """
+        return [f"{self.url}/doc/{k}" for k in range(n)]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
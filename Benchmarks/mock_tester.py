@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP server that stands in for the speedworld tester page (tool.chinaz.com) when
+testing geoblock_engine.py. Every page lists the same servers the way the real page does:
+a row per server shows up after a while as "正在加载..." and gets its HTTP status once the
+server has answered, or never. The prober is pointed at it with
+GeoblockProber(driver, countries, tester=MockTester().tester).
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# servers on the page: city, HTTP status, seconds until the row shows up and seconds until
+# the status shows up after that (None: keeps loading)
+servers = [["美国 洛杉矶", "200", 0.5, 1],
+           ["美国 纽约", "403", 0.5, 2],
+           ["日本 东京", "403", 1, 1],
+           ["韩国 首尔", "200", 1, 3],
+           ["荷兰 阿姆斯特丹", "", 1.5, None],
+           ["新加坡", "200", 6, 1]]
+# countries in the servers above, in the order of CheckGeoblocking.py
+countries = ["美国", "日本", "韩国", "荷兰", "新加坡"]
+
+page = """<html><head><meta charset="utf-8"><title>全球测速</title></head><body>
+<div id="speedlist"></div>
+<script>
+var servers = %s;
+var list = document.getElementById("speedlist");
+servers.forEach(function (server) {
+    setTimeout(function () {
+        var row = document.createElement("div");
+        row.className = "row listw clearfix";
+        row.innerHTML = '<div name="city">' + server[0] + '</div><div name="httpstate">正在加载...</div>';
+        list.appendChild(row);
+        if (server[3] !== null) {
+            setTimeout(function () {
+                row.querySelector("[name=httpstate]").innerText = server[1];
+            }, server[3] * 1000);
+        }
+    }, server[2] * 1000);
+});
+</script>
+</body></html>
+"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = (page % json.dumps(self.server.servers, ensure_ascii=False)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def expected(servers=servers, countries=countries):
+    """
+    Result geoblock_engine.GeoblockProber should find per country (in order as countries):
+    200 if any server is 200, else the first status, "unavailable" if every server keeps loading
+    """
+    results = []
+    for country in countries:
+        states = [server[1] for server in servers if country in server[0] and server[3] is not None]
+        if "200" in states:
+            results.append("200")
+        else:
+            results.append(states[0] if states else "unavailable")
+    return results
+
+
+class MockTester():
+    def __init__(self, servers=servers):
+        """
+        Starts the server on a free port of localhost, in a background thread
+
+        Parameters
+        ----------
+        servers : List
+            [city, status, shows up after, status after] per server on the page.
+
+        """
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.servers = servers
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        # tester page as in geoblock_engine.tester
+        self.tester = self.url + "/speedworld/{location}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Times the hot paths of the pipeline on synthetic corpora (synthetic_corpus.py) and the
+round 1 checks of CheckDeletion.py against a local mock server (mock_server.py). Results
+are saved as JSON in the results folder, named after the time and the git commit, so runs
+of different commits can be compared:
+
+    python run_benchmarks.py                                # run with the sizes below
+    python run_benchmarks.py 10000 100000                   # run with other sizes
+    python run_benchmarks.py compare results/a.json results/b.json
+"""
+
+import asyncio
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, "..", "Data gathering & processing"))
+sys.path.append(os.path.join(here, "..", "Analysis"))
+from synthetic_corpus import generate
+from mock_server import MockServer, expected
+
+# number of documents of each synthetic corpus (e.g. [10000, 100000, 1000000])
+sizes = [10000]
+# every benchmark is run this many times, the fastest run is reported
+repeats = 3
+# number of urls checked against the mock server
+check_links = 400
+# results are saved here
+results_dir = os.path.join(here, "results")
+# a benchmark counts as a regression when it takes this many times as long as before
+regression_threshold = 1.2
+
+
+def timed(func, *args):
+    """
+    Runs func repeats times
+
+    Returns
+    -------
+    seconds : Float
+        Time of the fastest run.
+    result : Var
+        Return value of the last run.
+
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def corpus_benchmarks(df):
+    """
+    Times reference extraction, title matching, document number parsing and the Fig_3 and
+    Fig_5 aggregations on one corpus
+
+    Returns
+    -------
+    results : List
+        Per benchmark: name, seconds and the number of items processed.
+
+    """
+    from reference_extractor import extract_references, iter_batches
+    from title_index import TitleIndex
+    from CreateCrossReferencedDataset import CrossReference
+    from doc_numbers import parse_doc_numbers, german_tank_estimates
+    from topics import transparency_rates
+    from publication_lag import lag_statistics
+
+    results = []
+
+    def add(name, seconds, items):
+        results.append({"name": name, "seconds": seconds, "items": items, "per_second": items / seconds})
+        print(f"  {name:<28} {seconds:9.3f} s  {items / seconds:14,.0f} items/s")
+
+    seconds, data = timed(lambda: extract_references(iter_batches(df)))
+    add("reference_extraction", seconds, len(df))
+
+    # titles stripped to Chinese characters and numbers, as the referred titles are
+    full_data = df.assign(title_clean=df["Title"].str.replace(r"[^\u4e00-\u9FFF\d]", "", regex=True))
+    seconds, index = timed(TitleIndex, full_data)
+    add("title_index_build", seconds, len(df))
+    titles = data["title"].tolist()
+    seconds, found = timed(CrossReference(index).check_batch, titles)
+    add("find_doc", seconds, len(titles))
+
+    seconds, parsed = timed(parse_doc_numbers, df["doc_number"])
+    add("doc_number_parsing", seconds, len(df))
+    seconds, _ = timed(german_tank_estimates, parsed)
+    add("german_tank_estimates", seconds, len(df))
+
+    cross_referenced = data.assign(fulltext_released_to_public=[r[0] for r in found])
+    seconds, _ = timed(transparency_rates, cross_referenced)
+    add("fig3_transparency_rates", seconds, len(cross_referenced))
+
+    dates = pd.DataFrame({"iss": df["Date"], "pub": df["Publishing date"]})
+    seconds, _ = timed(lag_statistics, dates)
+    add("fig5_lag_statistics", seconds, len(dates))
+    return results
+
+
+def check_benchmarks(n):
+    """
+    Times round 1 of CheckDeletion.py, blocking (Check.check_availability) and with the
+    asyncio engine, against the mock server. Both are timed again as a re-check, with the
+    ETag validators saved by the first run.
+
+    Returns
+    -------
+    results : List
+        Per benchmark: name, seconds, number of urls and the number of wrong results.
+
+    """
+    import rate_limiter
+    import async_check
+    from result_store import ResultStore
+    from CheckDeletion import Check, store_path
+
+    # measure the checks, not the pauses between requests to the same host
+    rate_limiter.initial_rate = rate_limiter.max_rate = 1e9
+    results = []
+    # the result store of Check is written to the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder, MockServer() as server:
+        os.chdir(folder)
+        try:
+            urls = server.links(n)
+            want = [expected(k) for k in range(n)]
+
+            def add(name, func):
+                seconds, found = timed(func)
+                wrong = sum(str(a) != str(b) for a, b in zip(found, want))
+                results.append({"name": name, "seconds": seconds, "items": n, "per_second": n / seconds,
+                                "wrong": wrong})
+                print(f"  {name:<28} {seconds:9.3f} s  {n / seconds:14,.0f} urls/s  ({wrong} wrong)")
+
+            check = Check(1)
+            add("check_availability", lambda: [check.check_availability(url) for url in urls])
+            add("async_check", lambda: asyncio.run(async_check.check_all(urls)))
+            # the first Check saved the validators of the pages
+            check.store.flush()
+            recheck = Check(1)
+            add("check_availability_recheck", lambda: [recheck.check_availability(url) for url in urls])
+            with ResultStore(store_path) as store:
+                add("async_check_recheck", lambda: asyncio.run(async_check.check_all(urls, store=store)))
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def environment():
+    """
+    Returns the commit and the machine the benchmarks ran on
+    """
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=here, capture_output=True, text=True).stdout.strip()
+        except OSError:
+            return ""
+
+    return {"commit": git("rev-parse", "HEAD"),
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__}
+
+
+def run(sizes=sizes):
+    """
+    Runs all benchmarks and saves the results
+
+    Returns
+    -------
+    path : Str
+        JSON file the results were saved to.
+
+    """
+    report = environment()
+    report["benchmarks"] = []
+    for size in sizes:
+        print(f"corpus of {size} documents")
+        df = generate(size)
+        for result in corpus_benchmarks(df):
+            report["benchmarks"].append({"size": size, **result})
+    print(f"{check_links} urls on the mock server")
+    for result in check_benchmarks(check_links):
+        report["benchmarks"].append({"size": check_links, **result})
+
+    os.makedirs(results_dir, exist_ok=True)
+    name = re.sub("[^0-9]", "", report["time"]) + "_" + (report["commit"][:8] or "nocommit")
+    path = os.path.join(results_dir, name + ".json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"saved to {path}")
+    return path
+
+
+def compare(old_path, new_path):
+    """
+    Prints the change in time of every benchmark between two result files
+
+    Returns
+    -------
+    regressions : List
+        (name, size, ratio) of the benchmarks that became slower than regression_threshold.
+
+    """
+    reports = []
+    for path in [old_path, new_path]:
+        with open(path, encoding="utf-8") as file:
+            reports.append(json.load(file))
+    old = {(b["name"], b["size"]): b["seconds"] for b in reports[0]["benchmarks"]}
+    print(f"{reports[0]['commit'][:8]} -> {reports[1]['commit'][:8]}")
+    regressions = []
+    for benchmark in reports[1]["benchmarks"]:
+        key = (benchmark["name"], benchmark["size"])
+        if key not in old:
+            continue
+        ratio = benchmark["seconds"] / old[key]
+        flag = ""
+        if ratio > regression_threshold:
+            flag = "  REGRESSION"
+            regressions.append((*key, ratio))
+        print(f"  {key[0]:<28} {key[1]:>9}  {old[key]:9.3f} s -> {benchmark['seconds']:9.3f} s  x{ratio:.2f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["compare"]:
+        sys.exit(1 if compare(sys.argv[2], sys.argv[3]) else 0)
+    run([int(arg) for arg in sys.argv[1:]] or sizes)
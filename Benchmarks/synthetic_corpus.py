@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Generates synthetic Chinese policy corpora with the columns of "data.xlsx", at any number of
+rows (e.g. 10k, 100k or 1M). Databases, administrative levels, issuers and permanence are
+drawn from the rows of the sample. Titles and document numbers follow the usual formats,
+and bodies refer to other documents with 《...》, mostly to documents of the corpus itself
+that were published earlier. This gives the pipeline realistic work to benchmark.
+
+Run from this folder, e.g. "python synthetic_corpus.py 100000" writes synthetic_100000.csv.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# the Excel cache lives with the data gathering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data gathering & processing"))
+from excel_cache import read_excel
+
+sample_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data gathering & processing", "data.xlsx")
+# range of issuing years
+first_year = 2005
+last_year = 2022
+# average number of 《...》 references per body
+references_per_body = 1.5
+# share of references to documents that are not in the corpus
+unpublished_share = 0.2
+# share of document numbers that do not follow the standard format
+malformed_share = 0.05
+# median body length in characters
+body_length = 900
+
+actions = ["印发", "加强", "推进", "做好", "进一步加强", "开展", "规范", "调整", "完善", "实施", "深化", "促进"]
+subjects = ["全省", "全市", "全国", "重点领域", "基层", "农村", "城市", "中小企业", "行业", "区域"]
+topic_words = ["科技创新", "生态环境保护", "就业", "养老服务", "社会保障", "对外贸易", "价格监管", "教育", "科研",
+               "医疗卫生", "药品", "干部管理", "纪律检查", "政府采购", "专项资金", "公共资源交易", "国有资产",
+               "国际合作", "互联网", "数据共享", "信息公开", "安全生产", "食品安全", "交通运输", "水利", "住房"]
+objects = ["工作", "管理", "改革", "试点", "建设", "发展", "体系建设", "专项行动", "监督检查", "服务"]
+kinds = ["通知", "意见", "实施意见", "办法", "暂行办法", "规定", "批复", "函", "公告", "决定"]
+documents = ["工作方案", "实施细则", "管理办法", "行动计划", "指导意见", "发展规划", "工作要点"]
+number_prefixes = ["国发", "国办发", "国办函", "财税", "发改价格", "京政发", "浙政发", "苏政办发", "粤府", "津政办发"]
+sentences = ["为深入贯彻落实党中央、国务院决策部署，",
+             "经研究，现将有关事项通知如下：",
+             "各地区、各部门要高度重视，切实加强组织领导，",
+             "进一步明确职责分工，建立健全工作机制，",
+             "加大政策支持力度，统筹推进各项工作任务落实。",
+             "要坚持问题导向，突出重点，",
+             "确保各项措施落到实处、取得实效。",
+             "请结合本地区实际，认真贯彻执行。",
+             "加强对政策执行情况的监督检查，",
+             "及时总结经验做法，",
+             "有关情况请及时报送。",
+             "本办法自发布之日起施行。",
+             "执行中遇到的问题，请及时向主管部门反映。",
+             "各有关单位要按照职责分工，密切配合，形成工作合力。"]
+
+
+def make_title(rng, issuer):
+    """
+    Returns a random policy title of issuer
+    """
+    kind = kinds[rng.integers(len(kinds))]
+    topic = topic_words[rng.integers(len(topic_words))] + objects[rng.integers(len(objects))]
+    if rng.random() < 0.3:
+        # e.g. 关于印发《...工作方案》的通知
+        return f"{issuer}关于印发《{topic}{documents[rng.integers(len(documents))]}》的通知", kind
+    return f"{issuer}关于{actions[rng.integers(len(actions))]}{subjects[rng.integers(len(subjects))]}{topic}的{kind}", kind
+
+
+def generate(n, seed=0):
+    """
+    Generates a synthetic corpus
+
+    Parameters
+    ----------
+    n : Int
+        Number of documents.
+    seed : Int
+        Seed of the random generator, the same seed gives the same corpus.
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        Columns of data.xlsx (Database, administrative_level, Date, Publishing date, Year,
+        main_issuer, Link, permanence, Title, Body), plus doc_type and doc_number, sorted by
+        publishing date.
+
+    """
+    rng = np.random.default_rng(seed)
+    sample = read_excel(sample_path)
+    profiles = sample[["Database", "administrative_level", "main_issuer", "permanence"]].to_numpy()
+    profile = profiles[rng.integers(len(profiles), size=n)]
+
+    # issuing dates, publishing some days later, in order of publication
+    start = np.datetime64(f"{first_year}-01-01")
+    days = (np.datetime64(f"{last_year + 1}-01-01") - start).astype(int)
+    issued = start + np.sort(rng.integers(days, size=n)).astype("timedelta64[D]")
+    published = issued + rng.exponential(20, size=n).astype("timedelta64[D]")
+    order = np.argsort(published, kind="stable")
+    issued, published, profile = issued[order], published[order], profile[order]
+    years = issued.astype("datetime64[Y]").astype(int) + 1970
+
+    titles = []
+    doc_types = []
+    doc_numbers = []
+    bodies = []
+    counters = {}
+    lengths = rng.lognormal(np.log(body_length), 0.8, size=n).astype(int)
+    references = rng.poisson(references_per_body, size=n)
+    for k in range(n):
+        title, kind = make_title(rng, str(profile[k][2]))
+        # some documents are news items or interpretations
+        if rng.random() < 0.05:
+            kind = ["新闻", "解读"][rng.integers(2)]
+        prefix = number_prefixes[rng.integers(len(number_prefixes))]
+        counters[(prefix, years[k])] = counters.get((prefix, years[k]), 0) + 1
+        if rng.random() < malformed_share:
+            doc_number = f"{prefix}[{years[k]}]{counters[(prefix, years[k])]}"
+        else:
+            doc_number = f"{prefix}〔{years[k]}〕{counters[(prefix, years[k])]}号"
+
+        parts = [f"索引号： {k:09d}/{years[k]}-{k % 1000000:06d}\n发布机构： {profile[k][2]} 成文日期： {issued[k]}\n"
+                 f"文号： {doc_number}\n{title}\n"]
+        size = len(parts[0])
+        for _ in range(references[k]):
+            if k and rng.random() > unpublished_share:
+                # a document published earlier
+                referred = titles[rng.integers(k)]
+            else:
+                referred = make_title(rng, str(profiles[rng.integers(len(profiles))][2]))[0]
+            parts.append(f"根据《{referred}》，")
+            size += len(referred) + 5
+        while size < lengths[k]:
+            sentence = sentences[rng.integers(len(sentences))]
+            parts.append(sentence)
+            size += len(sentence)
+        if rng.random() < 0.1:
+            # attachments are also written with 《》 but too short to count as a title
+            parts.append("\n附件：《申报表》")
+
+        titles.append(title)
+        doc_types.append(kind)
+        doc_numbers.append(doc_number)
+        bodies.append("".join(parts))
+
+    date = pd.Series(issued).dt.strftime("%Y-%m-%d")
+    return pd.DataFrame({"Database": profile[:, 0],
+                         "administrative_level": profile[:, 1],
+                         "Date": date,
+                         "Publishing date": pd.Series(published).dt.strftime("%Y-%m-%d"),
+                         "Year": years,
+                         "main_issuer": profile[:, 2],
+                         "Link": [f"http://www.gov{k % 97}.gov.cn/zhengce/{date[k][:7].replace('-', '')}/t{k}.html"
+                                  for k in range(n)],
+                         "permanence": profile[:, 3],
+                         "Title": titles,
+                         "Body": bodies,
+                         "doc_type": doc_types,
+                         "doc_number": doc_numbers})
+
+
+if __name__ == "__main__":
+    for n in [int(arg) for arg in sys.argv[1:]] or [10000]:
+        generate(n).to_csv(f".//synthetic_{n}.csv", index=False)
@@ -2,246 +2,391 @@
 
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
 import time
-import numpy as np
-from functools import partial
-from multiprocessing import Process
-
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import WebDriverException, SessionNotCreatedException
+from multiprocessing.util import Finalize
 
 import os
+import json
+from urllib.parse import urlsplit
 
-from get_chrome_driver import GetChromeDriver
+from availability import is_soft_404, is_html, page_text, conditional_headers, prefix_bytes, user_agent
+from result_store import ResultStore
+import scheduler
+from rate_limiter import RateLimiter, LimiterManager, throttle_codes, max_retries
+from excel_cache import read_excel, workbook_hash
+import metrics
 
 # set this to the max # of processor cores your system can dedicate to this task
 num_processes = 5
+# run round 1 with the asyncio engine (async_check.py) instead of one blocking request per process
+async_round_1 = True
+# results are saved here as they come in, a restarted run skips all urls that already have a result
+store_path = "check_deletion.sqlite"
+# the sample of links to check, saved so that a restarted run checks the same links
+sample_path = "checked_sample.xlsx"
+# the dataset the sample is drawn from
+data_path = "data.xlsx"
+# the path, mtime and hash of the dataset the sample was drawn from, a changed dataset gets a
+# new sample (and the results of the old sample are cleared)
+sample_key_path = "checked_sample.json"
+# round 1 results to re-run with selenium in round 2
+retry_codes = ["403", "408", "412", "420", "502", "521"]
+# run round 2 on a pool of headless browsers (driver_pool.py) instead of one browser per process
+use_driver_pool = True
+# number of links the scheduler hands to a process at a time
+batch_size = 10
+# set to True to check the whole sample again: the results of earlier runs are cleared, and
+# pages are requested with the ETag/Last-Modified they were served with before, so unchanged
+# pages come back as 304s
+recheck = False
+# selenium (driver_pool.py) and aiohttp (async_check.py) are only imported by the round that
+# uses them, so round 1 processes do not load selenium
 
 class Check():
-    def __init__(self, data_to_check, i, round_):
+    def __init__(self, round_, limiter=None, challenged=()):
         """
-        Uses Selenium and BeautifulSoup4/Requests to detect whether or not a link is still available. 
-        BS4 for first round, then goes over errors for a second time with Selenium to check for 
-        any errors related to scraper detection.
+        Uses Selenium and Requests to detect whether or not a link is still available. 
+        Requests for first round, then goes over errors for a second time with Selenium to check for 
+        any errors related to scraper detection. One Check is created in every scheduler process
+        and then handles the batches of links that process gets.
 
         Parameters
         ----------
-        data_to_check : Pandas DataFrame
-            Dataset with all the links to check.
-        i : Int
-            Number of the process for multiprocessing
         round_ : Int
-            Number of the check round (1=BeautifulSoup, 2=Selenium)
+            Number of the check round (1=Requests, 2=Selenium)
+        limiter : RateLimiter or NoneType
+            Per-host rate limits shared with the other processes (see LimiterManager), or
+            None for limits of this process only.
+        challenged : Collection
+            Round 2: urls whose host served a challenge page in round 1, they are watched
+            for at least driver_pool.min_dwell seconds.
+
+        """
+        self.round_ = round_
+        self.store = ResultStore(store_path)
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        # validators of the pages checked by earlier runs, for conditional requests
+        self.validators = self.store.validators() if round_ == 1 else {}
+        self.challenged = {str(url) for url in challenged}
+        if round_ == 2:
+            import driver_pool
+            self.driver = driver_pool.start_webdriver()
+            self.driver.set_page_load_timeout(driver_pool.page_load_timeout)
+            print("webdriver started")
+            # quit the browser when the process exits
+            Finalize(self, self.driver.quit, exitpriority=10)
+
+    def check_availability(self, url):
+        """
+
+        Parameters
+        ----------
+        url : Str
+            Url to check availability of
 
         Returns
         -------
-        None. Instead, saves data to Excel to be stiched back together later. 
+        Int
+            The http status code of the website 
 
         """
-        results = []
-
-        def check_availability(url):
-            """
-
-            Parameters
-            ----------
-            url : Str
-                Url to check availability of
-
-            Returns
-            -------
-            Int
-                The http status code of the website 
-
-            """
-            user_agt = "'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.53 Safari/537.36'"
-            headers = {'User-Agent': user_agt}
-            try:
-                page = requests.get(url, headers = headers, timeout=30)
-                if page.status_code == 404:
-                    print(404)
-                    print(url)
-                    return page.status_code
+        headers = {'User-Agent': user_agent}
+        validator = self.validators.get(str(url))
+        headers.update(conditional_headers(validator))
+        self.limiter.wait(url)
+        start = time.perf_counter()
+        try:
+            # only the headers are downloaded here, the body is read below as far as needed
+            with requests.get(url, headers = headers, timeout=30, stream=True) as page:
+                result = page.status_code
+                if page.status_code == 304 and validator:
+                    # not modified since it was last checked
+                    result = validator[2]
                 elif page.status_code == 200:
-                    soup = BeautifulSoup(page.content, "html.parser", from_encoding="utf-8")
-                    if (("访问" in soup.text or "页面" in soup.text) and 
-                        ("不存在" in soup.text or "删除" in soup.text or "找不到" in soup.text)):
-                        print(404)
-                        print(url)
-                        return 404
-                    else:
-                        return 200
-                else:
-                    return page.status_code
-                
-            except requests.exceptions.RequestException as e:
-                return "webpage unavailable"
-        
-        def check_availability_selenium(url, driver):
-            """
+                    content_type = page.headers.get("Content-Type")
+                    if is_html(content_type) and is_soft_404(page_text(read_prefix(page), content_type)):
+                        result = 404
+                    etag, last_modified = page.headers.get("ETag"), page.headers.get("Last-Modified")
+                    if etag or last_modified:
+                        self.store.add_validator(url, etag, last_modified, result)
+            metrics.request("check_round_1", url, time.perf_counter() - start, page.status_code)
+            self.limiter.update(url, page.status_code)
+            if result == 404:
+                print(404)
+                print(url)
+            return result
             
-            Parameters
-            ----------
-            url : Str
-                Url to check availability of
-            driver : Selenium Webdriver
-                Selenium Webdriver to execute
-
-            Returns
-            -------
-            Var
-                Page status code, or "webpage unavailable" if website remains unavailable
-
-            """
-            try:
-                driver.get(url)
-            except:
-                return "webpage unavailable"
-            time.sleep(5)
-            html = driver.find_element(By.XPATH, "/html").text
-            if (("访问" in html or "页面" in html) and 
-                ("不存在" in html or "删除" in html or "找不到" in html)):
-                return 404
-            else:
-                return None
-            
-        
-        if round_ == 1:
-            # iterate through all urls to check
-            for url in data_to_check["Link"]:
-                results.append(check_availability(url))
-            data_to_check["result"] = results
-            data_to_check.to_excel(f".//data_{str(i)}.xlsx")
+        except requests.exceptions.RequestException as e:
+            metrics.request("check_round_1", url, time.perf_counter() - start, "webpage unavailable")
+            return "webpage unavailable"
+    
+    def check_availability_selenium(self, url):
+        """
         
-        if round_ == 2:
-            
-            def start_webdriver():
-                """
-                Starts Chrome webdriver, installs via GetChromeDriver if not working first time
-                """
-                
-                options = webdriver.ChromeOptions() 
-                options.add_argument("start-maximized")
-                options.add_experimental_option("excludeSwitches", ["enable-automation"])
-                options.add_experimental_option('useAutomationExtension', False)
-                options.add_experimental_option('prefs',  {
-                    "download.prompt_for_download": False,
-                    "download.directory_upgrade": True,
-                    "plugins.always_open_pdf_externally": True
-                    }
-                )
-                options.add_argument("--disable-blink-features")
-                options.add_argument("--disable-blink-features=AutomationControlled")
-                #options.add_argument("--headless")
-                options.page_load_strategy = 'eager'
-                try:
-                    driver = webdriver.Chrome(options=options)
-                    
-                except (WebDriverException, SessionNotCreatedException):
-                    
-                    get_driver = GetChromeDriver()
-                    get_driver.install()
-                    driver = webdriver.Chrome(options=options)
-                    
-                except PermissionError: 
-                    os.rmdir("chromedriver")
-                    get_driver = GetChromeDriver()
-                    get_driver.install()
-                    driver = webdriver.Chrome(options=options)
-                driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-                driver.execute_cdp_cmd('Network.setUserAgentOverride', {"userAgent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.53 Safari/537.36'})
-                
-                return driver
-            
-            driver = start_webdriver()
-            print("webdriver started")
-            
-            # iterate through all urls to check
-            for j in range(len(data_to_check)):
-                
-                # only re-run error results
-                if str(data_to_check["result"][j]) in ["403", "408", "412", "420", "502", "521"]:
-                    result = check_availability_selenium(data_to_check["Link"][j], driver)
-                    if result:
-                        results.append(result)
-                    else:
-                        results.append(200)
-                else:
-                    results.append(data_to_check["result"][j])
-
-            data_to_check["result"] = results
-            data_to_check.to_excel(f".//data_{str(i)}.xlsx")
+        Parameters
+        ----------
+        url : Str
+            Url to check availability of
 
-if __name__ == "__main__":
-    
+        Returns
+        -------
+        Var
+            404 or 200, or "webpage unavailable" if website remains unavailable
+
+        """
+        import driver_pool
+        from selenium.common.exceptions import WebDriverException
+        dwell = driver_pool.min_dwell if str(url) in self.challenged else 0
+        start = time.perf_counter()
+        try:
+            # waits until the page has settled instead of a fixed time
+            result = driver_pool.check_availability(url, self.driver, dwell)
+        except WebDriverException:
+            result = "webpage unavailable"
+        metrics.request("check_round_2", url, time.perf_counter() - start, result)
+        return result
+
+    def check_batch(self, urls):
+        """
+        Checks a batch of links and saves the results to the result store (store_path)
+
+        Parameters
+        ----------
+        urls : List
+            Urls to check.
+
+        Returns
+        -------
+        results : List
+            Result for each url.
+
+        """
+        results = []
+        for url in urls:
+            if self.round_ == 1:
+                result = self.check_availability(url)
+                # try throttled urls again, the limiter has lowered the rate of their host
+                for _ in range(max_retries):
+                    if str(result) not in throttle_codes:
+                        break
+                    result = self.check_availability(url)
+            else:
+                result = self.check_availability_selenium(url)
+            self.store.add(self.round_, url, result)
+            results.append(result)
+        self.store.flush()
+        return results
+
+
+def read_prefix(page):
     """
-    This code uses two rounds: one using BS4/requests and one using selenium for the websites that blocked the requests in the first round. 
+    Reads the first prefix_bytes of a streamed response (decompressed)
     """
-    
-    #ROUND 1 CODE
-    data = pd.read_excel("data.xlsx")
+    prefix = bytearray()
+    for chunk in page.iter_content(chunk_size=16384):
+        prefix += chunk
+        if len(prefix) >= prefix_bytes:
+            break
+    return bytes(prefix[:prefix_bytes])
+
+# the Check of this scheduler process
+worker = None
+
+def init_worker(round_, limiter=None, challenged=()):
+    global worker
+    worker = Check(round_, limiter, challenged)
+
+def check_batch(urls):
+    return worker.check_batch(urls)
+
+def load_sample():
+    """
+    Returns the sample of links to check: the sample of an earlier run if it was drawn from
+    the current data_path, otherwise a new random sample of 50 links from each unique database
+
+    Returns
+    -------
+    checked : Pandas DataFrame
+        Sample of links, with the columns Database and Link.
+    new : bool
+        Whether the sample was drawn now, so results of an earlier sample do not apply.
+
+    """
+    key = {"path": data_path, "mtime": os.stat(data_path).st_mtime_ns,
+           "hash": workbook_hash(data_path)}
+    if os.path.exists(sample_path):
+        try:
+            with open(sample_key_path, encoding="utf-8") as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            # a sample saved before the key was kept, taken to be of the current data
+            saved = dict(key, mtime=None)
+        if saved["path"] == key["path"] and saved["hash"] == key["hash"]:
+            # continue with the sample of an earlier run
+            if saved != key:
+                with open(sample_key_path, "w", encoding="utf-8") as file:
+                    json.dump(key, file, indent=1)
+            return read_excel(sample_path), False
+        print(f"{data_path} has changed since {sample_path} was drawn, drawing a new sample")
+    data = read_excel(data_path)
     
     #create random sample of 50 links from each unique database
-    checked = pd.DataFrame()
+    samples = []
     for database in data["Database"].unique():
-        results = [] 
         try:
             df = data.loc[data["Database"] == database].sample(50).reset_index(drop=True)
         except ValueError:
             df = data.loc[data["Database"] == database].reset_index(drop=True)
-        df = df[["Database", "Link"]]
-        checked = checked.append(df)
-    
-    #break dataframe up in chunks for multiprocessing
-    dataframes = np.array_split(checked, num_processes)
-    func = partial(Check)
-    processes = []
-    
-    #execute round 1 
-    for i in range(num_processes):
-        print(f"process {str(i)} starting")
-        process_data = dataframes[i].reset_index(drop=True)
-        process = Process(target=func, args=(process_data, i, 1))
-        processes.append(process)
-        process.start()    
-    for process in processes:
-        process.join() 
+        samples.append(df[["Database", "Link"]])
+    checked = pd.concat(samples).reset_index(drop=True)
+    checked.to_excel(sample_path, index=False)
+    with open(sample_key_path, "w", encoding="utf-8") as file:
+        json.dump(key, file, indent=1)
+    return checked, True
+
+def save_counters(counters, checked):
+    """
+    Saves the per-host counters of the rate limiter to "host_counters.xlsx", with the
+    databases behind each host
+    """
+    if not len(counters):
+        return
+    hosts = checked["Link"].map(lambda url: urlsplit(str(url)).netloc)
+    databases = checked.groupby(hosts)["Database"].agg(lambda d: ", ".join(d.astype(str).unique()))
+    counters.insert(1, "Database", counters["host"].map(databases))
+    counters.to_excel(".//host_counters.xlsx")
+
+def round_1(checked, store):
+    """
+    Checks all links with requests and saves the results to
+    "checked_round_1.xlsx"
+
+    Parameters
+    ----------
+    checked : Pandas DataFrame
+        Sample of links, with the columns Database and Link.
+    store : ResultStore
+        Result store of the run, links that already have a round 1 result are skipped.
+
+    Returns
+    -------
+    cross_referenced : Pandas DataFrame
+        The sample with the round 1 result of each link.
+
+    """
+    with metrics.stage("check_round_1", len(checked)):
+        if async_round_1:
+            import async_check
+            #execute round 1 in this process, with pooled connections to each host
+            limiter = RateLimiter()
+            async_check.check_links(checked, store, limiter=limiter)
+            save_counters(limiter.counters(), checked)
+        else:
+            #execute round 1, skipping links checked in an earlier run
+            done = store.done(1)
+            to_check = [url for url in checked["Link"] if str(url) not in done]
+            #all processes take their turn from the same per-host rate limits
+            with LimiterManager() as manager:
+                limiter = manager.RateLimiter()
+                scheduler.run(check_batch, to_check, num_processes, batch_size, init_worker, (1, limiter),
+                              stage="check_round_1")
+                save_counters(limiter.counters(), checked)
     
-    #stich round 1 back together
-    cross_referenced = pd.DataFrame()
-    for i in range(num_processes):
-        df = pd.read_excel(f".//data_{str(i)}.xlsx")
-        cross_referenced = pd.concat([cross_referenced, df])
+    #stich round 1 back together from the result store
+    round_1 = store.results(1)
+    cross_referenced = checked.copy()
+    cross_referenced["result"] = [round_1[str(url)] for url in checked["Link"]]
     cross_referenced.to_excel(".//checked_round_1.xlsx")
+    return cross_referenced
+
+def round_2(cross_referenced, store):
+    """
+    Checks the links whose round 1 result is in retry_codes again with Selenium and saves the
+    results to "checked_round_2.xlsx"
+
+    Parameters
+    ----------
+    cross_referenced : Pandas DataFrame
+        The sample with the round 1 result of each link, see round_1.
+    store : ResultStore
+        Result store of the run, links that already have a round 2 result are skipped.
+
+    Returns
+    -------
+    cross_referenced : Pandas DataFrame
+        The sample with the final result of each link.
+
+    """
+    #only re-run error results, skipping those checked in an earlier run
+    done = store.done(2)
+    to_retry = [url for url, result in zip(cross_referenced["Link"], cross_referenced["result"])
+                if str(result) in retry_codes and str(url) not in done]
     
-    #ROUND 2 CODE
-       
-    #break dataframe up in chunks for multiprocessing
-    dataframes = np.array_split(cross_referenced, num_processes)
-    func = partial(Check)
-    processes = []
-    
-    #execute round 2
-    for i in range(num_processes):
-        print(f"process {str(i)} starting")
-        process_data = dataframes[i].reset_index(drop=True)
-        process = Process(target=func, args=(process_data, i, 2))
-        processes.append(process)
-        process.start()    
-    for process in processes:
-        process.join() 
+    with metrics.stage("check_round_2", len(to_retry)):
+        if to_retry:
+            import driver_pool
+            #hosts that served a challenge page in round 1 are watched until it has redirected
+            challenged = [url for url, result in zip(cross_referenced["Link"], cross_referenced["result"])
+                          if str(result) in driver_pool.challenge_codes]
+        if use_driver_pool:
+            #execute round 2 on the shared pool of browsers, saving each result as it comes in
+            if to_retry:
+                with driver_pool.DriverPool(num_processes) as pool:
+                    timings = pool.check_urls(to_retry, on_result=lambda url, result: store.add(2, url, result),
+                                              challenged=challenged)
+                store.flush()
+                timings = pd.DataFrame([[url] + list(timing) for url, timing in timings.items()],
+                                       columns=["Link", "result", "seconds", "driver"])
+                timings.to_excel(".//checked_round_2_timings.xlsx")
+        elif to_retry:
+            #execute round 2 with one browser per process
+            scheduler.run(check_batch, to_retry, num_processes, batch_size, init_worker, (2, None, challenged),
+                          stage="check_round_2")
     
-    # execute round 2
-    cross_referenced = pd.DataFrame()
-    for i in range(num_processes):
-        df = pd.read_excel(f".//data_{str(i)}.xlsx")
-        cross_referenced = pd.concat([cross_referenced, df])
+    #stich round 2 back together, keeping the round 1 result of links that were not re-run
+    round_2 = store.results(2)
+    cross_referenced = cross_referenced.copy()
+    cross_referenced["result"] = [round_2.get(str(url), result) for url, result
+                                  in zip(cross_referenced["Link"], cross_referenced["result"])]
     cross_referenced.to_excel(".//checked_round_2.xlsx")
+    return cross_referenced
+
+def main(rounds=(1, 2)):
+    """
+    This code uses two rounds: one using requests and one using selenium for the websites that blocked the requests in the first round. 
     
+    Parameters
+    ----------
+    rounds : Tuple
+        Rounds to run. Round 2 on its own continues from the round 1 results in the result
+        store (store_path).
+
+    """
+    #timings of this run are saved to metrics.jsonl and summarised in metrics.prom
+    metrics.enable()
+    metrics.reset()
+    checked, new_sample = load_sample()
     
-    
-    
-    
-    
\ No newline at end of file
+    with ResultStore(store_path) as store:
+        if (recheck and 1 in rounds) or new_sample:
+            #check every link again, keeping the validators of the pages
+            store.clear()
+        
+        #ROUND 1 CODE
+        if 1 in rounds:
+            cross_referenced = round_1(checked, store)
+        else:
+            round_1_results = store.results(1)
+            missing = [url for url in checked["Link"] if str(url) not in round_1_results]
+            if missing:
+                raise ValueError(f"{len(missing)} links of the sample have no round 1 result, run round 1 first")
+            cross_referenced = checked.copy()
+            cross_referenced["result"] = [round_1_results[str(url)] for url in checked["Link"]]
+        
+        #ROUND 2 CODE
+        if 2 in rounds:
+            round_2(cross_referenced, store)
+    metrics.export()
+
+if __name__ == "__main__":
+    main()
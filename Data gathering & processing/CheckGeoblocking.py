@@ -9,60 +9,80 @@ import pandas as pd
 import os
 from get_chrome_driver import GetChromeDriver
 
+from result_store import ResultStore
+import scheduler
+import geoblock_engine
+from excel_cache import read_excel
 
-from multiprocessing import Process
+from multiprocessing.util import Finalize
 
 # set this to the max # of processor cores your system can dedicate to this task
 num_processes = 1
+# results are saved here as they come in, a restarted run skips all urls that already have a result
+store_path = "check_geoblocking.sqlite"
+# probe several urls at once in tabs and take each result as soon as it has loaded, instead
+# of one url at a time with fixed sleeps
+use_prober = True
+# number of urls the scheduler hands to a process at a time
+batch_size = 10 if use_prober else 1
+
+# manually-specified countries to get results from
+countries = ["台湾", "香港", "日本", "韩国", "美国", "荷兰", "泰国", "新加坡", "俄罗斯"]
 
 class Scraper():
-    def __init__(self, df, range_start, range_end, range_interval):
+    def __init__(self):
+        """
+        Uses tool.chinaz.com to check availability of websites per geographic location. One Scraper
+        is created in every scheduler process and then handles the batches of urls that process gets.
+
+        """
+        
+        self.store = ResultStore(store_path, batch_size=10)
+        # start driver
+        self.start_driver()
+        print("driver started")
+        # quit the browser when the process exits
+        Finalize(self, self.quit_driver, exitpriority=10)
+        if use_prober:
+            self.prober = geoblock_engine.GeoblockProber(self.driver, countries, restart=self.restart_driver)
+        
+    def check_batch(self, urls):
         """
-        Uses tool.chinaz.com to check availability of websites per geographic location
 
         Parameters
         ----------
-        df : Pandas DataFrame
-            Contains all the localities to iterate through and find availability for.
-        range_start : Int
-            Start number for the range (for multiprocessing).
-        range_end : TYPE
-            Final number for the range (for multiprocessing).
-        range_interval : TYPE
-            Interval number for the range (for multiprocessing).
+        urls : List
+            Contains all the websites to find availability for.
 
         Returns
         -------
-        None. Instead, saves results as Excel format to be stiched together later.
+        results : List
+            Availability of each website per server (in order as countries). Also saved to
+            the result store (store_path).
 
         """
-        
-        
-        # manually-specified countries to get results from
-        countries = ["台湾", "香港", "日本", "韩国", "美国", "荷兰", "泰国", "新加坡", "俄罗斯"]
-        # create empty dataframe
-        cols = countries + ["url"]
-        checked_data = pd.DataFrame(columns=cols)
-        # start driver
-        self.start_driver()
-        print("driver started")
-        
-        # iterate through all the data points within this range for multiprocessing
-        for i in range(range_start, range_end, range_interval):
+        if use_prober:
+            # the prober saves each url as soon as all its countries are settled
+            checked = self.prober.check_urls(urls, on_result=lambda url, row: self.store.add(1, url, row))
+            self.store.flush()
+            return [checked[url] for url in urls]
+
+        results = []
+        for url in urls:
             # remove all http(s) headers
-            location = df["Url"][i].replace("http://","").replace("https://","")
+            location = url.replace("http://","").replace("https://","")
             # generate and get tester url
-            url = f"https://tool.chinaz.com/speedworld/{location}"
-            self.driver.get(url)
+            tester_url = f"https://tool.chinaz.com/speedworld/{location}"
+            self.driver.get(tester_url)
             time.sleep(10)
             
             # check status
             row = self.check_status(countries)
-            # append results to dataframe
-            to_save = row + [df["Url"][i]]
-            checked_data.loc[i] = to_save
-            # save to excel
-            checked_data.to_excel(f".//main__{str(range_start)}.xlsx")
+            # save to the result store
+            self.store.add(1, url, row)
+            results.append(row)
+        self.store.flush()
+        return results
         
     def check_status(self, countries):
         """
@@ -156,6 +176,19 @@ class Scraper():
         return results
             
         
+    def restart_driver(self):
+        """
+        Starts a new driver in place of one that has crashed, for the prober
+        """
+        self.start_driver()
+        return self.driver
+
+    def quit_driver(self):
+        try:
+            self.driver.quit()
+        except WebDriverException:
+            pass
+
     def start_driver(self):
         """
         Starts Chrome webdriver, installs via GetChromeDriver if not working first time
@@ -202,27 +235,40 @@ class Scraper():
         self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         self.driver.execute_cdp_cmd('Network.setUserAgentOverride', {"userAgent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.53 Safari/537.36'})
 
-if __name__ == "__main__":
+# the Scraper of this scheduler process
+worker = None
+
+def init_worker():
+    global worker
+    worker = Scraper()
+
+def check_batch(urls):
+    return worker.check_batch(urls)
+
+def main():
+    """
+    Checks the availability of all national and local websites from every location in
+    countries and saves the result to "geoblocking_tested_local.xlsx"
+    """
     
     # load datasets
-    national_websites = pd.read_excel("./national_websites.xlsx")
-    local_websites = pd.read_excel("./national_websites.xlsx")
-    df = pd.concat([national_websites, local_websites])
+    national_websites = read_excel("./national_websites.xlsx")
+    local_websites = read_excel("./national_websites.xlsx")
+    df = pd.concat([national_websites, local_websites]).reset_index(drop=True)
     
-    # execute multiprocessing
-    processes = []
-    for i in range(num_processes):
-        print(f"Process {str(i)} starting")
-        process = Process(target=Scraper, args=(df, i, len(df), num_processes))
-        processes.append(process)
-        process.start()
+    # execute multiprocessing, skipping urls checked in an earlier run
+    with ResultStore(store_path) as store:
+        done = store.done(1)
+    to_check = [url for url in df["Url"] if str(url) not in done]
+    scheduler.run(check_batch, to_check, num_processes, batch_size, init_worker)
     
-    for process in processes:
-        process.join() 
-    
-    # stitch dataframes back together
-    cross_referenced = pd.DataFrame()
-    for i in range(num_processes):
-        df = pd.read_excel(f".//main__{str(i)}.xlsx")
-        cross_referenced = pd.concat([cross_referenced, df])
+    # stitch results back together from the result store
+    with ResultStore(store_path) as store:
+        results = store.results(1)
+    rows = [i for i in range(len(df)) if str(df["Url"][i]) in results]
+    cross_referenced = pd.DataFrame([results[str(df["Url"][i])] for i in rows], index=rows, columns=countries)
+    cross_referenced["url"] = [df["Url"][i] for i in rows]
     cross_referenced.to_excel(".//geoblocking_tested_local.xlsx")
+
+if __name__ == "__main__":
+    main()
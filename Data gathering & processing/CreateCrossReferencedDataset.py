@@ -8,161 +8,198 @@ other datasets or for peer review.
 # imports
 import pandas as pd
 import re
-import progressbar as pb
-import numpy as np
-from functools import partial
-from multiprocessing import Pool, Process
+
+from title_index import TitleIndex
+from reference_extractor import parse_referred_titles, extract_references
+from ngram_index import NgramIndex
+from crossref_state import CrossReferenceState
+import shared_corpus
+import scheduler
+import metrics
+from excel_cache import read_excel
 
 # set this to the max # of processor cores your system can dedicate to this task
 num_processes = 5
+# publish the title index once in shared memory instead of copying it into every process
+use_shared_memory = True
+# save the title index of the whole dataset to this file and memory-map it in every process,
+# so a rerun on the same data loads it instead of building it again (None to always build)
+index_file = "title_index.bin"
+# number of titles the scheduler hands to a process at a time
+batch_size = 500
+# add the documents to the bigram index (ngram_index.sqlite) and extract the referenced titles
+# from the indexed documents that contain a 《 or 〈, instead of scanning every body
+use_ngram_index = False
+# keep the extracted titles and their results in cross_reference_state.sqlite, so that a rerun
+# only extracts the references of new documents and only checks new and unmatched titles
+incremental = False
 
 class CrossReference():
-    def __init__(self, data_to_check, full_data, i):
+    def __init__(self, index):
         """
-        Checks whether documents in a dataframe have been released to the public by cross-referencing
-        each document with the dataset of released documents. Saves it to an Excel file to be stitched
-        back together after multiprocessing is done
+        Checks whether documents have been released to the public by cross-referencing each
+        document with the dataset of released documents. One CrossReference is created in every
+        scheduler process and then handles the batches of titles that process gets.
 
         Parameters
         ----------
-        data_to_check : Pandas DataFrame
-            Contains all the document titles you want to check if they have been released to the public.
-        full_data : Pandas DataFrame
-            Contains all published documents you want to check against.
-        i : Int
-            The number of the process, used to save the dataframe and stich them back together later.
+        index : TitleIndex, Dict or Str
+            Index over all published documents you want to check against, built once in the main process,
+            the handle of an index published in shared memory, or the file of a saved index.
 
         """
-        
-        exists = []
-        dates = []
-        links = []
-        shortened_t = []
-
-        def find_doc(t, df):
-            """
-            Checks a title against the full dataframe to see if it exists
-
-            Parameters
-            ----------
-            t : String
-                Title to check.
-            df : Pandas DataFrame
-                Contains all published documents you want to check against.
-
-            Returns
-            -------
-            bool
-                True if document has been published, else False.
-            Int or NoneType
-                The year a document was published, or NoneType if not published.
-            String or NoneType
-                The url of the published document, or NoneType if not published.
-
-            """
-            
-            
-            for k in range(len(df)):
-                # check exact match of title 
-                if t == df["title_clean"][k]:
-                    return True, df["Year"][k], df["Link"][k]
-                # check non-exact match of title
-                elif (t in str(df["title_clean"][k])) and df["doc_type"][k] not in ["新闻", "解读"]:
-                    return True, df["Year"][k], df["Link"][k]
-            return False, None, None
-
-        for j in range(len(data_to_check)):
-            title = data_to_check["title"][j]
-            t = re.sub("[^\u4e00-\u9FFF\d]", "", title)
-            e, d, l = find_doc(t, full_data)
-            exists.append(e)
-            dates.append(d)
-            links.append(l)
-            shortened_t.append(t)
-
-        data_to_check["fulltext_released_to_public"] = exists
-        data_to_check["fulltext_pub_date"] = dates
-        data_to_check["fulltext_url"] = links
-        data_to_check["cleaned_title"] = shortened_t
-        data_to_check.to_excel(f".//data_{str(i)}.xlsx")
+        if isinstance(index, str):
+            index = TitleIndex.load(index)
+        elif not isinstance(index, TitleIndex):
+            index = shared_corpus.attach(index)
+        self.index = index
 
-
-if __name__ == "__main__":
-    # load data, sort by date, filter to date >= 2008
-    df = pd.read_excel(".\\data.xlsx").sort_values(by=["Publishing date"], ascending=True)
-    df = df.loc[df["Year"].astype(int) >= 2008].reset_index(drop=True)
-    # strip title down to only characters and numbers
-    df["title_clean"] = df["Title"].str.replace(r'[\u4e00-\u9FFF\d]', "", regex=True)
-    # only national level documents
-    df = df.loc[df["administrative_level"] == "Central"].reset_index(drop=True)
-
-    def parse_referred_titles(df):
+    def check_batch(self, titles):
         """
-        Extracts all referenced titles from a dataset
+        Checks a batch of titles
 
         Parameters
         ----------
-        df : Pandas DataFrame
-            Contains all documents to be extracted from.
+        titles : List
+            Contains all the document titles you want to check if they have been released to the public.
 
         Returns
         -------
-        data : Pandas DataFrame
-            Contains all extracted titles with their information.
+        results : List
+            Per title: whether it has been released, its publishing year and url, and the cleaned title.
 
         """
+        results = []
+        for title in titles:
+            t = re.sub("[^\u4e00-\u9FFF\d]", "", title)
+            e, d, l = self.index.find(t)
+            results.append((e, d, l, t))
+        return results
+
+
+# the CrossReference of this scheduler process
+worker = None
+
+def init_worker(index):
+    global worker
+    worker = CrossReference(index)
+
+def check_batch(titles):
+    return worker.check_batch(titles)
+
+
+def check_titles(titles, full_data, saved_index=None):
+    """
+    Checks titles against a dataset of published documents over num_processes processes
+
+    Parameters
+    ----------
+    titles : List
+        Titles to check.
+    full_data : Pandas DataFrame
+        Published documents to check against.
+    saved_index : Str or NoneType
+        File to keep the index of full_data in, see index_file.
+
+    Returns
+    -------
+    results : List
+        Per title, as CrossReference.check_batch.
+
+    """
+    if not titles:
+        return []
+    with metrics.stage("cross_reference", len(titles)):
+        if saved_index:
+            # build the index only if the data has changed, every process maps the same file
+            TitleIndex.cached(full_data, saved_index)
+            return scheduler.run(check_batch, titles, num_processes, batch_size, init_worker, (saved_index,),
+                                 stage="cross_reference")
+        # build the title index once, shared by all processes
+        index = TitleIndex(full_data)
+        if use_shared_memory:
+            shm, index = shared_corpus.publish(index)
+        try:
+            return scheduler.run(check_batch, titles, num_processes, batch_size, init_worker, (index,),
+                                 stage="cross_reference")
+        finally:
+            if use_shared_memory:
+                shm.close()
+                shm.unlink()
+
+
+def update_state(df, state):
+    """
+    Brings a saved state up to date with a dataset: extracts the references of the new
+    documents, checks new titles against the whole dataset and the titles that were not found
+    before against the new documents. Nothing is saved until every step has finished.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        All documents, prepared as in the main block.
+    state : CrossReferenceState
+        State of the last run.
+
+    """
+    new_documents = state.new_documents(df).reset_index(drop=True)
+    # without new documents there are no new titles, and nothing new to find the old ones in
+    if new_documents.empty:
+        return
+    unmatched = state.unmatched()
+    new_titles = state.add_references(parse_referred_titles(new_documents, num_processes))
+    state.save_results(new_titles, check_titles(new_titles, df, index_file))
+    # a title that was not found can only be found in the new documents
+    results = check_titles(unmatched, new_documents)
+    state.save_results([title for title, r in zip(unmatched, results) if r[0]], [r for r in results if r[0]])
+    state.add_documents(new_documents["Link"])
+    state.commit()
+
+
+def main():
+    """
+    Extracts all referenced titles from the national level documents of "data.xlsx", looks
+    them up among the published titles and saves the result to "cross_referenced.xlsx"
+    """
+    # timings of this run are saved to metrics.jsonl and summarised in metrics.prom
+    metrics.enable()
+    metrics.reset()
+    
+    # load data, sort by date, filter to date >= 2008
+    df = read_excel(".\\data.xlsx").sort_values(by=["Publishing date"], ascending=True)
+    df = df.loc[df["Year"].astype(int) >= 2008].reset_index(drop=True)
+    # strip title down to only characters and numbers
+    df["title_clean"] = df["Title"].str.replace(r'[\u4e00-\u9FFF\d]', "", regex=True)
+    # only national level documents
+    df = df.loc[df["administrative_level"] == "Central"].reset_index(drop=True)
+
+    if incremental:
+        with CrossReferenceState() as state:
+            update_state(df, state)
+            cross_referenced = state.table()
+    else:
+        # extract all referenced titles, fanned out over the same number of processes
+        if use_ngram_index:
+            with NgramIndex() as ngram_index:
+                ngram_index.add_documents(df)
+                # only the documents of df, the index can hold documents of earlier datasets
+                data = extract_references(ngram_index.iter_batches(ngram_index.doc_ids(df["Link"])),
+                                          num_processes)
+        else:
+            data = parse_referred_titles(df, num_processes)
         
-        list_of_titles = []
-        list_of_referral_dates = []
-        list_of_referral_urls = []
-        
-        # progressbar as script can take long to finish (+= 15 mins on 300k documents)
-        widgets = [f' Parsing {str(len(df))} documents', pb.Percentage(), ' ',pb.Bar(marker=pb.RotatingMarker()), ' ', pb.ETA()]
-        timer = pb.ProgressBar(widgets=widgets, maxval=len(df)).start()
-        
-        # iterate through each document in database
-        for i in range(len(df)):
-            # regex for referred-titles
-            # note: this also extracts self-references and references to e.g., attachments
-            x = re.findall("[《〈][^》]{7,60}[》〉]", str(df["Body"][i]))
-            for string in x:
-                # only append if not already in list
-                if string[1:-1] not in list_of_titles:
-                    list_of_titles.append(string[1:-1])
-                    list_of_referral_dates.append(df["Publishing date"][i])
-                    list_of_referral_urls.append(df["Link"][i])
-            timer.update(i)
-        timer.finish()
+        # execute processes, each takes the next batch of titles when done with its last
+        results = check_titles(data["title"].tolist(), df, index_file)
         
-        data = pd.DataFrame({"title": list_of_titles, "referral_date": list_of_referral_dates, "referred_in": list_of_referral_urls})
-        return data
-            
-    data = parse_referred_titles(df)
-    
-    # break dataframes up in chunks for multiprocessing    
-    dataframes = np.array_split(data, num_processes)
-    checked_data = pd.DataFrame()
-    func = partial(CrossReference)
-    processes = []
-    
-    # execute processes
-    for i in range(num_processes):
-        print(f"process {str(i)} starting")
-        process_data = dataframes[i].reset_index(drop=True)
-        process = Process(target=func, args=(process_data, df, i))
-        processes.append(process)
-        process.start()    
-    for process in processes:
-        process.join() 
-    
-    # stich partial dataframes back together
-    cross_referenced = pd.DataFrame()
-    for i in range(num_processes):
-        df = pd.read_excel(f".//data_{str(i)}.xlsx")
-        cross_referenced = pd.concat([cross_referenced, df])
+        # results come back in the same order as the titles
+        cross_referenced = data
+        cross_referenced["fulltext_released_to_public"] = [r[0] for r in results]
+        cross_referenced["fulltext_pub_date"] = [r[1] for r in results]
+        cross_referenced["fulltext_url"] = [r[2] for r in results]
+        cross_referenced["cleaned_title"] = [r[3] for r in results]
     cross_referenced.to_excel(".//cross_referenced.xlsx")
+    metrics.export()
 
 
-
-
-
+if __name__ == "__main__":
+    main()
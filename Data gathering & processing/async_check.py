@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio engine for round 1 of CheckDeletion.py. Keeps many requests in flight over pooled
+keep-alive connections, with a limit on the total number of connections and on the number
+of connections to any one host.
+"""
+
+import asyncio
+import time
+import aiohttp
+from urllib.parse import urlsplit
+
+from availability import is_soft_404, is_html, page_text, conditional_headers, prefix_bytes, user_agent
+from rate_limiter import throttle_codes, max_retries
+import metrics
+
+# max number of open connections in total
+max_connections = 50
+# max number of open connections to a single host
+max_per_host = 4
+# seconds to wait for a connection or for data, as with requests' timeout
+timeout = 30
+
+
+async def read_prefix(page):
+    """
+    Reads the first prefix_bytes of a response (decompressed)
+    """
+    prefix = bytearray()
+    while len(prefix) < prefix_bytes:
+        chunk = await page.content.read(prefix_bytes - len(prefix))
+        if not chunk:
+            break
+        prefix += chunk
+    return bytes(prefix)
+
+
+async def check_availability(session, url, validator=None, store=None):
+    """
+    Checks a single url, applying the same rules as Check.check_availability
+
+    Parameters
+    ----------
+    session : aiohttp ClientSession
+        Session holding the connection pool.
+    url : Str
+        Url to check availability of
+    validator : Tuple or NoneType
+        (etag, last_modified, result) of an earlier check, see ResultStore.validators. The
+        page is requested conditionally and its earlier result is given if it has not been
+        modified.
+    store : ResultStore or NoneType
+        If given, the validators of the page are saved to it.
+
+    Returns
+    -------
+    Int or Str
+        The http status code of the website, 404 for soft 404 pages, or
+        "webpage unavailable" if the request failed
+
+    """
+    try:
+        async with session.get(url, headers=conditional_headers(validator)) as page:
+            if page.status == 304 and validator:
+                result = validator[2]
+            elif page.status == 200:
+                content_type = page.headers.get("Content-Type")
+                result = 200
+                if is_html(content_type) and is_soft_404(page_text(await read_prefix(page), content_type)):
+                    result = 404
+                etag, last_modified = page.headers.get("ETag"), page.headers.get("Last-Modified")
+                if store is not None and (etag or last_modified):
+                    store.add_validator(url, etag, last_modified, result)
+            else:
+                result = page.status
+            if result == 404:
+                print(404)
+                print(url)
+            return result
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        return "webpage unavailable"
+
+
+def interleave_hosts(urls):
+    """
+    Orders urls round-robin over their hosts, so that the per-host limit does not leave
+    the other connections idle when many urls of the same host follow each other
+
+    Parameters
+    ----------
+    urls : List
+        Urls to check.
+
+    Returns
+    -------
+    order : List
+        Positions of the urls in the order to check them.
+
+    """
+    per_host = {}
+    for position, url in enumerate(urls):
+        per_host.setdefault(urlsplit(str(url)).netloc, []).append(position)
+    queues = list(per_host.values())
+    order = []
+    for rank in range(max((len(q) for q in queues), default=0)):
+        order.extend(q[rank] for q in queues if rank < len(q))
+    return order
+
+
+async def check_all(urls, connections=None, per_host=None, store=None, limiter=None):
+    """
+    Checks all urls concurrently
+
+    Parameters
+    ----------
+    urls : List
+        Urls to check.
+    connections : Int or NoneType
+        Max number of open connections in total, defaults to max_connections.
+    per_host : Int or NoneType
+        Max number of open connections to a single host, defaults to max_per_host.
+    store : ResultStore or NoneType
+        If given, each result is also added to the store as round 1, and pages are requested
+        conditionally with the validators saved in the store.
+    limiter : RateLimiter or NoneType
+        If given, requests to each host are spaced out by its token bucket, and throttled
+        urls are tried again up to max_retries times.
+
+    Returns
+    -------
+    results : List
+        Result for each url, in the same order as urls.
+
+    """
+    connections = connections or max_connections
+    per_host = per_host or max_per_host
+    results = [None] * len(urls)
+    attempts = [0] * len(urls)
+    validators = store.validators() if store is not None else {}
+    queue = asyncio.Queue()
+    for position in interleave_hosts(urls):
+        queue.put_nowait(position)
+
+    connector = aiohttp.TCPConnector(limit=connections, limit_per_host=per_host)
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout,
+                                     headers={'User-Agent': user_agent}) as session:
+
+        async def worker():
+            while not queue.empty():
+                position = queue.get_nowait()
+                url = str(urls[position])
+                if limiter is not None:
+                    await limiter.acquire(url)
+                start = time.perf_counter()
+                results[position] = await check_availability(session, url, validators.get(url), store)
+                metrics.request("check_round_1", url, time.perf_counter() - start, results[position])
+                metrics.queue_depth("check_round_1", queue.qsize())
+                if limiter is not None:
+                    limiter.update(url, results[position])
+                    if str(results[position]) in throttle_codes and attempts[position] < max_retries:
+                        attempts[position] += 1
+                        queue.put_nowait(position)
+                        continue
+                if store is not None:
+                    store.add(1, urls[position], results[position])
+
+        await asyncio.gather(*[worker() for _ in range(connections)])
+    return results
+
+
+def check_links(data_to_check, store=None, connections=None, per_host=None, limiter=None):
+    """
+    Runs round 1 over a dataframe of links
+
+    Parameters
+    ----------
+    data_to_check : Pandas DataFrame
+        Dataset with all the links to check, in the column "Link".
+    store : ResultStore or NoneType
+        If given, links that already have a round 1 result in the store are skipped and new
+        results are added to it.
+    connections : Int or NoneType
+        Max number of open connections in total.
+    per_host : Int or NoneType
+        Max number of open connections to a single host.
+    limiter : RateLimiter or NoneType
+        Per-host rate limiter, see check_all().
+
+    Returns
+    -------
+    data_to_check : Pandas DataFrame
+        The same dataset with the column "result" added.
+
+    """
+    urls = data_to_check["Link"].tolist()
+    if store is None:
+        data_to_check["result"] = asyncio.run(check_all(urls, connections, per_host, limiter=limiter))
+    else:
+        done = store.done(1)
+        asyncio.run(check_all([url for url in urls if str(url) not in done], connections, per_host, store, limiter))
+        round_1 = store.results(1)
+        data_to_check["result"] = [round_1[str(url)] for url in urls]
+    return data_to_check
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Shared rules for classifying whether a document is still available, used by all
+CheckDeletion engines. Only the start of a page (prefix_bytes) is read to look for a soft 404
+message, and pages that are not HTML (e.g. PDF attachments) are not read at all.
+"""
+
+import html
+import re
+
+user_agent = "'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.53 Safari/537.36'"
+
+# a page is a soft 404 if it has one word of each list
+soft_404_pages = ["访问", "页面"]
+soft_404_reasons = ["不存在", "删除", "找不到"]
+# number of bytes of a page that are read, soft 404 pages say so near the top
+prefix_bytes = 64 * 1024
+# content types that are read, a page of any other type (e.g. a PDF) counts as available
+html_types = ["text/html", "application/xhtml+xml"]
+
+charset_pattern = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+# tags, comments, scripts and styles, which are not part of the text of a page
+markup_pattern = re.compile(r"<!--.*?-->|<script.*?</script>|<style.*?</style>|<[^>]*>", re.IGNORECASE | re.DOTALL)
+
+
+def is_soft_404(text):
+    """
+    Checks whether a page says the document cannot be found
+
+    Parameters
+    ----------
+    text : Str
+        Text of the page
+
+    Returns
+    -------
+    bool
+        True if the page is a "page does not exist/has been deleted/cannot be found" page.
+
+    """
+    return (any(word in text for word in soft_404_pages) and
+            any(word in text for word in soft_404_reasons))
+
+
+def is_html(content_type):
+    """
+    Checks whether a page has to be read, i.e. is HTML or has no Content-Type
+    """
+    return not content_type or content_type.split(";")[0].strip().lower() in html_types
+
+
+def page_text(prefix, content_type=None):
+    """
+    Decodes the start of a page and strips its markup
+
+    Parameters
+    ----------
+    prefix : Bytes
+        First bytes of the page, see prefix_bytes.
+    content_type : Str or NoneType
+        Content-Type header, its charset is used if it has one.
+
+    Returns
+    -------
+    text : Str
+        Text of the page, as BeautifulSoup's text would give it.
+
+    """
+    charset = None
+    if content_type and "charset=" in content_type.lower():
+        charset = content_type.lower().split("charset=")[-1].split(";")[0].strip(" \"'")
+    else:
+        match = charset_pattern.search(prefix)
+        if match:
+            charset = match.group(1).decode("ascii").lower()
+    # gb18030 decodes everything gb2312 and gbk do
+    if charset in ["gb2312", "gbk"]:
+        charset = "gb18030"
+    try:
+        text = prefix.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        text = prefix.decode("utf-8", errors="replace")
+    return html.unescape(markup_pattern.sub("", text))
+
+
+def conditional_headers(validator):
+    """
+    Returns the If-None-Match/If-Modified-Since headers for the validators of a page
+
+    Parameters
+    ----------
+    validator : Tuple or NoneType
+        (etag, last_modified, result) as saved by ResultStore.add_validator.
+
+    """
+    headers = {}
+    if validator:
+        if validator[0]:
+            headers["If-None-Match"] = validator[0]
+        if validator[1]:
+            headers["If-Modified-Since"] = validator[1]
+    return headers
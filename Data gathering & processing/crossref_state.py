@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Saved state of CreateCrossReferencedDataset.py for incremental runs. The state holds the
+links of all documents whose references have been extracted, and every referenced title
+with its first referral and the result of its last check. A new run then only extracts the
+references of new documents, checks new titles against the whole dataset, and checks the
+titles that were not found before against the new documents only. A title that has been
+found keeps the document it was found in, even if documents that are added later (e.g. an
+older document scraped late) would have matched first in a full run.
+"""
+
+import sqlite3
+
+import pandas as pd
+
+# the state is saved here
+state_path = "cross_reference_state.sqlite"
+# number of links looked up per query
+chunk_size = 500
+
+
+class CrossReferenceState():
+    def __init__(self, path=state_path):
+        """
+        Opens (or creates) the state. Changes are only saved by commit(), so an interrupted
+        run leaves the state of the last completed run.
+
+        Parameters
+        ----------
+        path : Str
+            Path of the SQLite file.
+
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS documents (link TEXT PRIMARY KEY)")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS titles (
+                                   title TEXT PRIMARY KEY,
+                                   position INTEGER,
+                                   referral_date TEXT,
+                                   referred_in TEXT,
+                                   released INTEGER,
+                                   pub_year INTEGER,
+                                   url TEXT,
+                                   cleaned_title TEXT)""")
+        self.connection.commit()
+
+    def new_documents(self, df):
+        """
+        Returns the documents of df whose references have not been extracted yet
+
+        Parameters
+        ----------
+        df : Pandas DataFrame
+            Documents with the column Link.
+
+        Returns
+        -------
+        new : Pandas DataFrame
+            Rows of df that are new, in the same order.
+
+        """
+        links = df["Link"].astype(str).tolist()
+        known = set()
+        unique_links = list(dict.fromkeys(links))
+        for start in range(0, len(unique_links), chunk_size):
+            chunk = unique_links[start:start + chunk_size]
+            known.update(row[0] for row in self.connection.execute(
+                f"SELECT link FROM documents WHERE link IN ({','.join('?' * len(chunk))})", chunk))
+        return df.loc[[link not in known for link in links]]
+
+    def add_documents(self, links):
+        """
+        Records that the references of these documents have been extracted
+        """
+        self.connection.executemany("INSERT OR IGNORE INTO documents VALUES (?)", ((str(link),) for link in links))
+
+    def unmatched(self):
+        """
+        Returns all titles that have not been found in the dataset so far
+        """
+        return [row[0] for row in self.connection.execute("SELECT title FROM titles WHERE NOT released "
+                                                          "ORDER BY position")]
+
+    def add_references(self, data):
+        """
+        Adds extracted titles. A title that was referred to before keeps its first referral,
+        unless the new referral was published earlier.
+
+        Parameters
+        ----------
+        data : Pandas DataFrame
+            Extracted titles with the columns title, referral_date and referred_in, as
+            returned by reference_extractor.parse_referred_titles.
+
+        Returns
+        -------
+        new_titles : List
+            Titles that were not referred to before, still to be checked.
+
+        """
+        position = self.connection.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM titles").fetchone()[0]
+        new_titles = []
+        for title, date, link in zip(data["title"], data["referral_date"], data["referred_in"]):
+            date = str(date)
+            row = self.connection.execute("SELECT referral_date FROM titles WHERE title = ?", (title,)).fetchone()
+            if row is None:
+                self.connection.execute("INSERT INTO titles (title, position, referral_date, referred_in, released) "
+                                        "VALUES (?, ?, ?, ?, 0)", (title, position, date, str(link)))
+                position += 1
+                new_titles.append(title)
+            elif date < row[0]:
+                self.connection.execute("UPDATE titles SET referral_date = ?, referred_in = ? WHERE title = ?",
+                                        (date, str(link), title))
+        return new_titles
+
+    def save_results(self, titles, results):
+        """
+        Saves the check results of titles, as returned by CrossReference.check_batch
+        """
+        self.connection.executemany("UPDATE titles SET released = ?, pub_year = ?, url = ?, cleaned_title = ? "
+                                    "WHERE title = ?",
+                                    ((int(e), d, l, t, title) for title, (e, d, l, t) in zip(titles, results)))
+
+    def commit(self):
+        self.connection.commit()
+
+    def table(self):
+        """
+        Returns the cross-referenced dataset
+
+        Returns
+        -------
+        data : Pandas DataFrame
+            Columns as in cross_referenced.xlsx, in order of first referral.
+
+        """
+        data = pd.read_sql_query("SELECT title, referral_date, referred_in, released AS fulltext_released_to_public, "
+                                 "pub_year AS fulltext_pub_date, url AS fulltext_url, cleaned_title "
+                                 "FROM titles ORDER BY referral_date, position", self.connection)
+        data["fulltext_released_to_public"] = data["fulltext_released_to_public"].astype(bool)
+        return data
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of long-lived headless Chrome drivers for round 2 of CheckDeletion.py. Each driver runs
+in its own thread and takes urls from a shared work queue. Pages are read once they have
+settled (loaded, and url and text unchanged between two looks) instead of after a fixed sleep,
+and drivers that crash are replaced.
+"""
+
+import os
+import queue
+import threading
+import time
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException, SessionNotCreatedException
+
+from get_chrome_driver import GetChromeDriver
+
+from availability import is_soft_404
+import metrics
+
+# number of browsers in the pool
+num_drivers = 5
+# run the browsers without a window
+headless = True
+# max seconds to wait for a page to settle before reading it
+wait_timeout = 10
+# min seconds a challenge page is watched before it is read: hosts that answered
+# challenge_codes in round 1 first serve a JS challenge page, which only redirects to the
+# document after a few seconds, as does any page that keeps changing after it has loaded
+min_dwell = 5
+# round 1 answers of hosts that serve a JS challenge page
+challenge_codes = ["412", "521"]
+# seconds between two looks at a page while it settles
+poll_interval = 0.5
+# max seconds for driver.get before the url counts as unavailable
+page_load_timeout = 30
+
+
+def start_webdriver(headless=headless):
+    """
+    Starts Chrome webdriver, installs via GetChromeDriver if not working first time
+    """
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("start-maximized")
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option('useAutomationExtension', False)
+    options.add_experimental_option('prefs',  {
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "plugins.always_open_pdf_externally": True
+        }
+    )
+    options.add_argument("--disable-blink-features")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    if headless:
+        options.add_argument("--headless")
+    options.page_load_strategy = 'eager'
+    try:
+        driver = webdriver.Chrome(options=options)
+
+    except (WebDriverException, SessionNotCreatedException):
+
+        get_driver = GetChromeDriver()
+        get_driver.install()
+        driver = webdriver.Chrome(options=options)
+
+    except PermissionError:
+        os.rmdir("chromedriver")
+        get_driver = GetChromeDriver()
+        get_driver.install()
+        driver = webdriver.Chrome(options=options)
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    driver.execute_cdp_cmd('Network.setUserAgentOverride', {"userAgent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.53 Safari/537.36'})
+
+    return driver
+
+
+def is_alive(driver):
+    """
+    Checks whether a driver still responds
+    """
+    try:
+        driver.current_url
+        return True
+    except WebDriverException:
+        return False
+
+
+def wait_until_settled(driver, dwell=0):
+    """
+    Waits until a page has loaded and its url and text stay the same between two looks, at
+    most wait_timeout seconds. A page that still changes after it has loaded is taken for a
+    challenge page that redirects, and is watched for at least min_dwell seconds.
+
+    Parameters
+    ----------
+    driver : Selenium Webdriver
+        Driver that has loaded the page.
+    dwell : Float
+        Min seconds to watch the page, e.g. min_dwell for a host that is known to serve
+        a challenge page.
+
+    """
+    start = time.monotonic()
+    last = None
+    while time.monotonic() - start < wait_timeout:
+        try:
+            state = driver.execute_script(
+                "return [document.readyState, location.href, document.documentElement.innerText]")
+        except WebDriverException:
+            # the page is being replaced, e.g. by the redirect of a challenge page
+            state = None
+        if state is not None and last is not None and last[0] == "complete" and state != last:
+            dwell = max(dwell, min_dwell)
+        if state is not None and state == last and state[0] == "complete" and time.monotonic() - start >= dwell:
+            return
+        last = state
+        time.sleep(poll_interval)
+
+
+def check_availability(url, driver, dwell=0):
+    """
+    Loads a url and waits until the page has settled instead of a fixed time
+
+    Parameters
+    ----------
+    url : Str
+        Url to check availability of
+    driver : Selenium Webdriver
+        Selenium Webdriver to execute
+    dwell : Float
+        Min seconds to watch the page, see wait_until_settled.
+
+    Returns
+    -------
+    Var
+        404 if the page says the document does not exist, else 200, or "webpage unavailable"
+        if the website remains unavailable
+
+    """
+    try:
+        driver.get(url)
+    except WebDriverException:
+        return "webpage unavailable"
+    # reads whatever has loaded by wait_timeout
+    wait_until_settled(driver, dwell)
+    html = driver.find_element(By.XPATH, "/html").text
+    if is_soft_404(html):
+        return 404
+    else:
+        return 200
+
+
+class DriverPool():
+    def __init__(self, size=num_drivers, headless=headless):
+        """
+        Starts a pool of Chrome drivers
+
+        Parameters
+        ----------
+        size : Int
+            Number of drivers.
+        headless : bool
+            Whether to run the browsers without a window.
+
+        """
+        self.size = size
+        self.headless = headless
+        self.drivers = [self.start() for _ in range(size)]
+        print(f"{str(size)} webdrivers started")
+
+    def start(self):
+        driver = start_webdriver(self.headless)
+        driver.set_page_load_timeout(page_load_timeout)
+        return driver
+
+    def check_urls(self, urls, on_result=None, challenged=()):
+        """
+        Checks all urls, spread over the drivers through a shared work queue
+
+        Parameters
+        ----------
+        urls : List
+            Urls to check.
+        on_result : Function or NoneType
+            Called as on_result(url, result) as soon as a url is done, e.g. to save it. It is
+            called from the thread that called check_urls.
+        challenged : Collection
+            Urls whose host answered with one of challenge_codes in round 1, they are
+            watched for at least min_dwell seconds.
+
+        Returns
+        -------
+        results : Dict
+            Url -> (result, seconds taken, number of the driver).
+
+        Raises
+        ------
+        Exception
+            The error of the last driver that could not be restarted, if no driver is left
+            to check the remaining urls.
+
+        """
+        work = queue.Queue()
+        for url in urls:
+            work.put(url)
+        challenged = {str(url) for url in challenged}
+        # results are passed back to this thread, which calls on_result, so e.g. a ResultStore
+        # is only used from the thread that opened it; (None, error) if a driver is given up
+        done = queue.Queue()
+        results = {}
+        errors = []
+
+        def run(n):
+            while self.drivers[n] is not None:
+                try:
+                    url = work.get_nowait()
+                except queue.Empty:
+                    return
+                dwell = min_dwell if str(url) in challenged else 0
+                start = time.perf_counter()
+                failed = None
+                try:
+                    result = check_availability(url, self.drivers[n], dwell)
+                except WebDriverException:
+                    result = None
+                # replace a crashed driver and try the url once more
+                if result is None or (result == "webpage unavailable" and not is_alive(self.drivers[n])):
+                    try:
+                        self.recycle(n)
+                        result = check_availability(url, self.drivers[n], dwell)
+                    except WebDriverException:
+                        result = "webpage unavailable"
+                    except Exception as error:
+                        # no new browser could be started, the other drivers take the rest
+                        print(f"webdriver {str(n)} could not be restarted: {error!r}")
+                        self.drivers[n] = None
+                        result = "webpage unavailable"
+                        failed = error
+                seconds = time.perf_counter() - start
+                metrics.request("check_round_2", url, seconds, result)
+                # the page is loaded by the browser, not by this process, so no CPU time is counted
+                metrics.batch("check_round_2", 1, seconds, 0.0, worker=f"driver {n}")
+                metrics.queue_depth("check_round_2", work.qsize())
+                done.put((url, (result, seconds, n)))
+                if failed is not None:
+                    done.put((None, failed))
+
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(self.size)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads) or not done.empty():
+            try:
+                url, timing = done.get(timeout=1)
+            except queue.Empty:
+                continue
+            if url is None:
+                errors.append(timing)
+                continue
+            results[url] = timing
+            if on_result:
+                on_result(url, timing[0])
+        for thread in threads:
+            thread.join()
+        if not work.empty():
+            raise errors[-1] if errors else RuntimeError("no webdrivers left to check the urls")
+        return results
+
+    def recycle(self, n):
+        """
+        Replaces driver n with a new one
+        """
+        if self.drivers[n] is not None:
+            try:
+                self.drivers[n].quit()
+            except WebDriverException:
+                pass
+        self.drivers[n] = self.start()
+        print(f"webdriver {str(n)} restarted")
+
+    def close(self):
+        for driver in self.drivers:
+            if driver is None:
+                continue
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar cache for the Excel files read by the pipelines and the analysis scripts. The first
+read of a workbook parses it with openpyxl as before and saves the result as a Parquet file
+in a .excel_cache folder next to it; later reads load the Parquet file instead. A cached file
+is only used while the workbook has the same contents, so editing a workbook simply makes the
+next read parse it again.
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import defaultdict
+
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# folder (next to each workbook) that holds its cached copies
+cache_dir = ".excel_cache"
+# set to False to always read the workbooks themselves
+use_cache = True
+# number of rows per chunk when streaming a file that is too large to load at once
+chunk_size = 100000
+
+
+def file_hash(path):
+    """
+    Hashes the contents of a file
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _content_hash(path, folder):
+    """
+    Returns the hash of a workbook. Hashes are kept per path and mtime in index.json, so an
+    unchanged workbook is not hashed again.
+    """
+    stat = os.stat(path)
+    index_path = os.path.join(folder, "index.json")
+    try:
+        with open(index_path, encoding="utf-8") as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        index = {}
+    name = os.path.basename(path)
+    entry = index.get(name)
+    if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return entry["hash"]
+
+    content_hash = file_hash(path)
+    index[name] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": content_hash}
+    temp_path = index_path + f".{os.getpid()}"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(index, file, indent=1)
+    os.replace(temp_path, index_path)
+    return content_hash
+
+
+def workbook_hash(path):
+    """
+    Returns the hash of the contents of a workbook, as used for its cached copies. It is only
+    computed again when the workbook has been changed since.
+    """
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), cache_dir)
+    os.makedirs(folder, exist_ok=True)
+    return _content_hash(path, folder)
+
+
+def _save(data, cache_path):
+    """
+    Saves a dataframe as Parquet, or as a pickle if pyarrow cannot store it (e.g. a column
+    that mixes numbers and text). Returns the path written.
+    """
+    if pyarrow is not None:
+        try:
+            temp_path = cache_path + f".{os.getpid()}.parquet"
+            data.to_parquet(temp_path)
+            os.replace(temp_path, cache_path + ".parquet")
+            return cache_path + ".parquet"
+        except (pyarrow.ArrowException, ValueError, TypeError):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    temp_path = cache_path + f".{os.getpid()}.pkl"
+    data.to_pickle(temp_path)
+    os.replace(temp_path, cache_path + ".pkl")
+    return cache_path + ".pkl"
+
+
+def read_excel(path, **kwargs):
+    """
+    Reads an Excel file like pandas.read_excel, from the cache if the workbook is unchanged
+
+    Parameters
+    ----------
+    path : Str
+        Path of the workbook.
+    **kwargs
+        Passed on to pandas.read_excel. They are part of the cache key, so reading the same
+        workbook with other arguments is cached separately.
+
+    Returns
+    -------
+    data : Pandas DataFrame
+        Contents of the workbook.
+
+    """
+    # several sheets at once come back as a dict, which is not cached
+    if not use_cache or kwargs.get("sheet_name", 0) is None or isinstance(kwargs.get("sheet_name"), list):
+        return pd.read_excel(path, **kwargs)
+
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), cache_dir)
+    os.makedirs(folder, exist_ok=True)
+    key = hashlib.blake2b(repr(sorted(kwargs.items())).encode("utf-8"), digest_size=8).hexdigest()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(folder, f"{stem}-{_content_hash(path, folder)}-{key}")
+
+    if os.path.exists(cache_path + ".parquet"):
+        return pd.read_parquet(cache_path + ".parquet")
+    if os.path.exists(cache_path + ".pkl"):
+        return pd.read_pickle(cache_path + ".pkl")
+
+    data = pd.read_excel(path, **kwargs)
+    saved = _save(data, cache_path)
+    # remove the copies of earlier versions of the workbook
+    earlier = re.compile(re.escape(stem) + r"-[0-9a-f]{32}-" + key + r"\.(parquet|pkl)")
+    for name in os.listdir(folder):
+        if earlier.fullmatch(name) and os.path.join(folder, name) != saved:
+            os.remove(os.path.join(folder, name))
+    return data
+
+
+def clear(folder="."):
+    """
+    Deletes the cached copies of all workbooks in a folder
+    """
+    cache_folder = os.path.join(folder, cache_dir)
+    if os.path.isdir(cache_folder):
+        for name in os.listdir(cache_folder):
+            os.remove(os.path.join(cache_folder, name))
+        os.rmdir(cache_folder)
+
+
+def _header(values):
+    """
+    Names the columns as pandas.read_excel does: an empty cell becomes "Unnamed: n", and a
+    name that comes again becomes "name.1", "name.2", ... (skipping names that are taken),
+    the given names first and then the unnamed ones
+    """
+    unnamed = [n for n, value in enumerate(values) if value is None or value == ""]
+    names = [f"Unnamed: {n}" if n in unnamed else value for n, value in enumerate(values)]
+    counts = defaultdict(int)
+    for n in [n for n in range(len(names)) if n not in unnamed] + unnamed:
+        name = original = names[n]
+        count = counts[name]
+        while count > 0:
+            counts[original] = count + 1
+            name = f"{original}.{count}"
+            count = count + 1 if name in names else counts[name]
+        names[n] = name
+        counts[name] = count + 1
+    return names
+
+
+def iter_chunks(path, size=chunk_size):
+    """
+    Reads a file in chunks of rows, without loading it all. The chunks have the columns
+    read_excel (and pandas.read_excel) gives the first sheet.
+
+    Parameters
+    ----------
+    path : Str
+        .xlsx or .csv file.
+    size : Int
+        Number of rows per chunk.
+
+    Yields
+    ------
+    chunk : Pandas DataFrame
+        Next rows of the file.
+
+    """
+    if os.path.splitext(path)[1].lower() == ".csv":
+        yield from pd.read_csv(path, chunksize=size)
+        return
+
+    # only imported here, reads from the cache do not need openpyxl
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True)
+    try:
+        # pandas reads the first sheet, which need not be the active one
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = _header(next(rows))
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == size:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Geoblocking prober for CheckGeoblocking.py. Keeps several tester pages open in tabs of one
+driver and reads all result rows of a page in a single script call. Each country's result
+is taken as soon as it has loaded, and a country that does not load in time is timed out on
+its own instead of holding up the whole row. A tab that crashes, or whose page shows no
+result box, only costs the url it was probing (its countries are recorded as unknown), and
+is replaced. Benchmarks/mock_tester.py stands in for the tester page.
+"""
+
+import time
+
+from selenium.common.exceptions import WebDriverException
+
+# tester page, {location} is the url without http(s)://
+tester = "https://tool.chinaz.com/speedworld/{location}"
+# number of tester pages to keep open at once
+max_tabs = 5
+# max seconds to wait for the result of a country, from when its first row shows up (or, for
+# a country without rows, from when the last new row showed up)
+country_timeout = 60
+# max seconds to wait for the result box of a tester page, without it the countries are unknown
+box_timeout = 15
+# seconds before a country without a 200 may be settled, the page keeps adding rows until then
+settle_after = 10
+# seconds between two reads of the open pages
+poll_interval = 1
+
+# reads every result row as [city, httpstate, still loading], or null if there is no result box
+collect_rows = """
+var list = document.getElementById("speedlist");
+if (!list) { return null; }
+return Array.from(list.querySelectorAll(".row.listw.clearfix")).map(function (row) {
+    var city = row.querySelector("[name=city]");
+    var state = row.querySelector("[name=httpstate]");
+    return [city ? city.innerText : "", state ? state.innerText.trim() : "",
+            row.innerText.indexOf("正在加载...") >= 0];
+});
+"""
+
+status_codes = [str(status_code) for status_code in range(200, 599)]
+
+
+def assign(rows, countries, complete=True, timed_out=False):
+    """
+    Finds the result per country in a single pass over the rows. A country is 200 if any of
+    its rows is 200, else the first status code among its rows, else "unavailable".
+
+    Parameters
+    ----------
+    rows : List or NoneType
+        [city, httpstate, still loading] per row, as returned by collect_rows.
+    countries : List
+        List of countries (in Chinese) that have servers on the website to check.
+    complete : bool
+        Whether the page has listed all its rows, so that countries without a 200 may be settled.
+    timed_out : bool
+        Whether to settle every country with the rows loaded so far.
+
+    Returns
+    -------
+    results : Dict
+        Country -> result, only for the countries that are settled.
+
+    """
+    if rows is None:
+        # no result box found, assume no result found
+        return {country: None for country in countries} if timed_out else {}
+    if not complete and not timed_out:
+        loading = set(countries)
+    else:
+        loading = set()
+    first_status = {}
+    found_200 = set()
+    for city, http_state, is_loading in rows:
+        if is_loading and not city.strip():
+            # row without a city yet, could be any country
+            loading.update(countries)
+        for country in countries:
+            if country in city:
+                if is_loading:
+                    loading.add(country)
+                elif http_state == "200":
+                    found_200.add(country)
+                elif http_state in status_codes and country not in first_status:
+                    first_status[country] = http_state
+
+    results = {}
+    for country in countries:
+        if country in found_200:
+            results[country] = "200"
+        elif country not in loading or timed_out:
+            results[country] = first_status.get(country, "unavailable")
+    return results
+
+
+class GeoblockProber():
+    def __init__(self, driver, countries, tabs=max_tabs, tester=tester, restart=None):
+        """
+        Probes websites from several tester pages at once
+
+        Parameters
+        ----------
+        driver : Selenium Webdriver
+            Driver to open the tester pages in.
+        countries : List
+            List of countries (in Chinese) that have servers on the website to check.
+        tabs : Int
+            Number of tester pages to keep open at once.
+        tester : Str
+            Tester page, {location} is the url without http(s)://.
+        restart : Function or NoneType
+            Called without arguments to get a new driver when the driver has crashed, or
+            None to raise the error instead.
+
+        """
+        self.driver = driver
+        self.countries = countries
+        self.tester = tester
+        self.restart = restart
+        self.open_tabs(tabs)
+
+    def open_tabs(self, tabs):
+        """
+        Opens the tester tabs in the current driver
+        """
+        self.handles = [self.driver.current_window_handle]
+        for _ in range(tabs - 1):
+            self.driver.switch_to.new_window("tab")
+            self.handles.append(self.driver.current_window_handle)
+
+    def check_urls(self, urls, on_result=None):
+        """
+        Checks all urls, keeping every tab busy until all are done
+
+        Parameters
+        ----------
+        urls : List
+            Websites to check.
+        on_result : Function or NoneType
+            Called as on_result(url, row) as soon as a url is done, e.g. to save it.
+
+        Returns
+        -------
+        results : Dict
+            Url -> availability per server (in order as countries), None for a country
+            whose result is unknown.
+
+        """
+        to_check = list(urls)
+        # per busy tab: url, start time, the countries settled so far and when each country's
+        # first row showed up
+        busy = {}
+        results = {}
+
+        def finish(handle):
+            # countries that are not settled (the tab broke down) are unknown
+            url, _, settled, _ = busy.pop(handle)
+            row = [settled.get(country) for country in self.countries]
+            results[url] = row
+            if on_result:
+                on_result(url, row)
+
+        def recover(handle):
+            # gives up the url of a broken tab and replaces the tab, or the whole driver
+            print(f"tester tab failed, countries of {busy[handle][0]} are unknown")
+            finish(handle)
+            try:
+                self.driver.switch_to.new_window("tab")
+                new_handle = self.driver.current_window_handle
+                try:
+                    self.driver.switch_to.window(handle)
+                    self.driver.close()
+                except WebDriverException:
+                    pass
+                self.handles[self.handles.index(handle)] = new_handle
+            except WebDriverException:
+                if self.restart is None:
+                    raise
+                # the driver itself is gone, the urls of the other tabs are probed again
+                for other in list(busy):
+                    to_check.insert(0, busy.pop(other)[0])
+                try:
+                    self.driver.quit()
+                except WebDriverException:
+                    pass
+                self.driver = self.restart()
+                self.open_tabs(len(self.handles))
+                print("driver restarted")
+
+        while to_check or busy:
+            # start a tester page in every free tab
+            for handle in list(self.handles):
+                if handle in self.handles and handle not in busy and to_check:
+                    url = to_check.pop(0)
+                    location = url.replace("http://", "").replace("https://", "")
+                    busy[handle] = (url, time.monotonic(), {}, {})
+                    try:
+                        self.driver.switch_to.window(handle)
+                        self.driver.get(self.tester.format(location=location))
+                    except WebDriverException:
+                        recover(handle)
+
+            # collect what has landed on every open page
+            for handle in list(busy):
+                if handle not in busy:
+                    # given up when the driver was restarted
+                    continue
+                url, start, settled, shown = busy[handle]
+                try:
+                    self.driver.switch_to.window(handle)
+                    rows = self.driver.execute_script(collect_rows)
+                except WebDriverException:
+                    recover(handle)
+                    continue
+                now = time.monotonic()
+                pending = [c for c in self.countries if c not in settled]
+                if rows is None:
+                    # no result box (yet), a tester page that never shows one is given up
+                    timed_out = pending if now - start > box_timeout else []
+                else:
+                    for city, _, _ in rows:
+                        for country in self.countries:
+                            if country in city and country not in shown:
+                                shown[country] = now
+                    last_shown = max(shown.values(), default=start)
+                    timed_out = [c for c in pending if now - shown.get(c, last_shown) > country_timeout]
+                settled.update(assign(rows, [c for c in pending if c not in timed_out], now - start > settle_after))
+                if timed_out:
+                    settled.update(assign(rows, timed_out, timed_out=True))
+                if len(settled) == len(self.countries):
+                    finish(handle)
+
+            if busy:
+                time.sleep(poll_interval)
+        return results
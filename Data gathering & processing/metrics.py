@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation for the crawl and matching pipelines. Every process appends its events
+(stage timings, requests, batches done per worker, queue depth) to one JSON lines file, and
+export() summarises the file in the Prometheus text format: wall and CPU time per stage,
+latency histograms and status codes per host, throughput per worker and queue depth. This
+shows which stages and which government websites bound a run. Recording is off unless a
+run turns it on with enable(), as the main() of the pipelines does, so modules used as a
+library (e.g. from the analysis scripts or the notebooks) write no events.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# events are appended here by every process
+events_path = "metrics.jsonl"
+# the summary is written here by export()
+prometheus_path = "metrics.prom"
+# environment variable through which processes started by a run inherit enable()
+environ_key = "PIPELINE_METRICS"
+# whether events are recorded, set by enable()
+enabled = os.environ.get(environ_key) == "1"
+# upper bounds (in seconds) of the buckets of the request latency histograms
+latency_buckets = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+# events are written to disk once this many have been collected
+flush_every = 200
+# seconds between two samples of the queue depth of the same stage
+queue_interval = 1.0
+
+
+class Recorder():
+    def __init__(self):
+        """
+        Collects the events of this process and appends them to events_path in batches.
+        Safe to use from several threads (e.g. the drivers of a DriverPool).
+        """
+        self.pending = []
+        self.sampled = {}
+        self.lock = threading.Lock()
+
+    def record(self, event, **fields):
+        if not enabled:
+            return
+        fields.update(event=event, time=time.time(), pid=os.getpid())
+        with self.lock:
+            self.pending.append(fields)
+            if len(self.pending) >= flush_every:
+                self._flush()
+
+    def flush(self):
+        """
+        Writes all collected events to disk
+        """
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            lines = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in self.pending)
+            # one write per flush, so the lines of different processes do not interleave
+            with open(events_path, "a", encoding="utf-8") as file:
+                file.write(lines)
+            self.pending = []
+
+    def reset(self):
+        # a forked process starts without the events of its parent
+        self.pending = []
+        self.sampled = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, items=None):
+        """
+        Times a stage of a run, in wall time and CPU time of this process
+
+        Parameters
+        ----------
+        name : Str
+            Name of the stage, e.g. "check_round_1".
+        items : Int or NoneType
+            Number of items the stage handles. Can also be set later through the yielded
+            dictionary (info["items"] = ...).
+
+        """
+        info = {"items": items}
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield info
+        finally:
+            self.record("stage", stage=name, wall=time.perf_counter() - wall,
+                        cpu=time.process_time() - cpu, items=info["items"])
+            self.flush()
+
+    def request(self, stage, url, seconds, result):
+        """
+        Records one request: its host, how long it took and its result
+        """
+        self.record("request", stage=stage, host=urlsplit(str(url)).netloc, seconds=seconds, result=str(result))
+
+    def batch(self, stage, items, wall, cpu, worker=None):
+        """
+        Records a batch done by a worker (a process, or e.g. a driver of a DriverPool), and
+        writes the events, as worker processes can be stopped without warning
+        """
+        self.record("batch", stage=stage, worker=str(os.getpid() if worker is None else worker),
+                    items=items, wall=wall, cpu=cpu)
+        self.flush()
+
+    def queue_depth(self, stage, depth):
+        """
+        Records the number of items still waiting, at most once every queue_interval seconds
+        and when the queue has run empty
+        """
+        now = time.monotonic()
+        if depth == 0 or stage not in self.sampled or now - self.sampled[stage] >= queue_interval:
+            self.sampled[stage] = now
+            self.record("queue", stage=stage, depth=depth)
+
+
+# the Recorder of this process
+recorder = Recorder()
+stage = recorder.stage
+request = recorder.request
+batch = recorder.batch
+queue_depth = recorder.queue_depth
+atexit.register(recorder.flush)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=recorder.reset)
+
+
+def enable(on=True):
+    """
+    Turns recording on (or off) for this process and the processes it starts
+    """
+    global enabled
+    enabled = on
+    os.environ[environ_key] = "1" if on else "0"
+
+
+def reset():
+    """
+    Removes the events of an earlier run
+    """
+    recorder.flush()
+    if os.path.exists(events_path):
+        os.remove(events_path)
+
+
+def read_events(path=None):
+    """
+    Reads all events from a JSON lines file
+    """
+    recorder.flush()
+    events = []
+    with open(path or events_path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                events.append(json.loads(line))
+    return events
+
+
+def _labels(**labels):
+    escaped = {key: str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+               for key, value in labels.items()}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def export(path=None, out=None):
+    """
+    Summarises the events in the Prometheus text format
+
+    Parameters
+    ----------
+    path : Str or NoneType
+        JSON lines file with the events, defaults to events_path.
+    out : Str or NoneType
+        File to write, defaults to prometheus_path.
+
+    Returns
+    -------
+    text : Str
+        The summary as written.
+
+    """
+    stages = defaultdict(lambda: [0.0, 0.0, 0])
+    workers = defaultdict(lambda: [0.0, 0.0, 0])
+    queues = {}
+    hosts = defaultdict(lambda: [[0] * len(latency_buckets), 0.0, 0])
+    results = defaultdict(int)
+    for event in read_events(path):
+        if event["event"] == "stage":
+            totals = stages[event["stage"]]
+            totals[0] += event["wall"]
+            totals[1] += event["cpu"]
+            totals[2] += event["items"] or 0
+        elif event["event"] == "batch":
+            totals = workers[(event["stage"], event["worker"])]
+            totals[0] += event["wall"]
+            totals[1] += event["cpu"]
+            totals[2] += event["items"]
+        elif event["event"] == "queue":
+            peak = queues.get(event["stage"], (0, 0))[1]
+            queues[event["stage"]] = (event["depth"], max(peak, event["depth"]))
+        elif event["event"] == "request":
+            histogram = hosts[(event["stage"], event["host"])]
+            for n, bound in enumerate(latency_buckets):
+                if event["seconds"] <= bound:
+                    histogram[0][n] += 1
+            histogram[1] += event["seconds"]
+            histogram[2] += 1
+            results[(event["stage"], event["host"], event["result"])] += 1
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{labels} {value:g}" if isinstance(value, float) else f"{name}{labels} {value}"
+                     for labels, value in samples)
+
+    metric("pipeline_stage_wall_seconds_total", "counter", "Wall time per stage.",
+           [(_labels(stage=s), t[0]) for s, t in stages.items()])
+    metric("pipeline_stage_cpu_seconds_total", "counter", "CPU time of the main process per stage.",
+           [(_labels(stage=s), t[1]) for s, t in stages.items()])
+    metric("pipeline_stage_items_total", "counter", "Items handled per stage.",
+           [(_labels(stage=s), t[2]) for s, t in stages.items()])
+    metric("pipeline_worker_wall_seconds_total", "counter", "Time spent on batches per worker.",
+           [(_labels(stage=s, worker=w), t[0]) for (s, w), t in workers.items()])
+    metric("pipeline_worker_cpu_seconds_total", "counter", "CPU time spent on batches per worker.",
+           [(_labels(stage=s, worker=w), t[1]) for (s, w), t in workers.items()])
+    metric("pipeline_worker_items_total", "counter", "Items done per worker.",
+           [(_labels(stage=s, worker=w), t[2]) for (s, w), t in workers.items()])
+    metric("pipeline_worker_items_per_second", "gauge", "Throughput per worker while busy.",
+           [(_labels(stage=s, worker=w), t[2] / t[0] if t[0] else 0.0) for (s, w), t in workers.items()])
+    metric("pipeline_queue_depth", "gauge", "Items still waiting at the last sample.",
+           [(_labels(stage=s), q[0]) for s, q in queues.items()])
+    metric("pipeline_queue_depth_max", "gauge", "Most items waiting at any sample.",
+           [(_labels(stage=s), q[1]) for s, q in queues.items()])
+    # the buckets are cumulative: a request counts for every bound it is below
+    lines.append("# HELP check_request_seconds Request latency per host.")
+    lines.append("# TYPE check_request_seconds histogram")
+    for (s, host), (buckets, total, count) in hosts.items():
+        for bound, value in zip(latency_buckets + ["+Inf"], buckets + [count]):
+            lines.append(f"check_request_seconds_bucket{_labels(stage=s, host=host, le=bound)} {value}")
+        lines.append(f"check_request_seconds_sum{_labels(stage=s, host=host)} {total:g}")
+        lines.append(f"check_request_seconds_count{_labels(stage=s, host=host)} {count}")
+    metric("check_responses_total", "counter", "Results per host (status code or error).",
+           [(_labels(stage=s, host=host, result=result), count) for (s, host, result), count in results.items()])
+
+    text = "\n".join(lines) + "\n"
+    with open(out or prometheus_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    return text
+
+
+if __name__ == "__main__":
+    export()
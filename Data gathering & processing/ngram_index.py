@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent inverted index over the character bigrams of the titles and bodies of a corpus.
+Documents are added in batches as they are scraped (documents whose Link is already indexed
+are skipped), and a phrase is looked up by intersecting the documents of its bigrams and
+checking only those, instead of scanning every body.
+"""
+
+import sqlite3
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# the index is saved here
+index_path = "ngram_index.sqlite"
+# fields that are indexed, with the column they are read from
+fields = {"title": "Title", "body": "Body"}
+# number of documents read from disk per query
+chunk_size = 500
+# number of documents whose postings are held in memory before they are written to disk
+flush_every = 5000
+
+
+def bigrams(text):
+    """
+    Returns the set of character bigrams of a text
+    """
+    return set(map("".join, zip(text, text[1:])))
+
+
+def _text(value):
+    # empty cells are indexed as empty texts
+    return "" if pd.isna(value) else str(value)
+
+
+class NgramIndex():
+    def __init__(self, path=index_path):
+        """
+        Opens (or creates) an index
+
+        Every document gets a doc_id in order of insertion. Per field and bigram, the
+        postings table holds the sorted doc_ids that contain the bigram, as a uint32 array;
+        every call of add_documents() appends one row per bigram, which compact() merges.
+        Texts are saved compressed, to check the candidates of a lookup.
+
+        Parameters
+        ----------
+        path : Str
+            Path of the SQLite file.
+
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS documents (
+                                   doc_id INTEGER PRIMARY KEY,
+                                   link TEXT UNIQUE,
+                                   year INTEGER,
+                                   database TEXT,
+                                   date TEXT,
+                                   title BLOB,
+                                   body BLOB)""")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS postings (field TEXT, gram TEXT, docs BLOB)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS postings_gram ON postings (field, gram)")
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def add_documents(self, df):
+        """
+        Adds all documents that are not indexed yet
+
+        The postings are written to disk every flush_every documents, so the memory used
+        does not grow with the size of df.
+
+        Parameters
+        ----------
+        df : Pandas DataFrame
+            Documents with the columns Link, Year, Database, Publishing date, Title and Body.
+
+        Returns
+        -------
+        added : Int
+            Number of documents added.
+
+        """
+        known = {row[0] for row in self.connection.execute("SELECT link FROM documents")}
+        doc_id = self.connection.execute("SELECT COALESCE(MAX(doc_id) + 1, 0) FROM documents").fetchone()[0]
+        added = 0
+        rows = []
+        postings = {field: {} for field in fields}
+        for link, year, database, date, title, body in zip(
+                df["Link"], df["Year"], df["Database"], df["Publishing date"], df["Title"], df["Body"]):
+            link = str(link)
+            if link in known:
+                continue
+            known.add(link)
+            texts = {"title": _text(title), "body": _text(body)}
+            for field, text in texts.items():
+                for gram in bigrams(text):
+                    postings[field].setdefault(gram, []).append(doc_id)
+            rows.append((doc_id, link, None if pd.isna(year) else int(year), _text(database), _text(date),
+                         zlib.compress(texts["title"].encode("utf-8")),
+                         zlib.compress(texts["body"].encode("utf-8"))))
+            doc_id += 1
+            if len(rows) == flush_every:
+                added += self._write(rows, postings)
+                rows = []
+                postings = {field: {} for field in fields}
+        return added + self._write(rows, postings)
+
+    def _write(self, rows, postings):
+        # saves the documents and postings collected by add_documents
+        if rows:
+            self.connection.executemany("INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            # doc_ids are added in increasing order, so every list is sorted
+            self.connection.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                        ((field, gram, np.array(docs, dtype=np.uint32).tobytes())
+                                         for field in fields for gram, docs in postings[field].items()))
+            self.connection.commit()
+        return len(rows)
+
+    def doc_ids(self, links):
+        """
+        Returns the doc_ids of the indexed documents among links, sorted
+        """
+        links = [str(link) for link in links]
+        found = []
+        for start in range(0, len(links), chunk_size):
+            chunk = links[start:start + chunk_size]
+            found += [row[0] for row in self.connection.execute(
+                f"SELECT doc_id FROM documents WHERE link IN ({','.join('?' * len(chunk))})", chunk)]
+        return np.array(sorted(found), dtype=np.uint32)
+
+    def compact(self):
+        """
+        Merges the postings of every bigram into a single row
+        """
+        grams = self.connection.execute("SELECT field, gram FROM postings GROUP BY field, gram "
+                                        "HAVING COUNT(*) > 1").fetchall()
+        for field, gram in grams:
+            docs = self._postings(field, gram)
+            self.connection.execute("DELETE FROM postings WHERE field = ? AND gram = ?", (field, gram))
+            self.connection.execute("INSERT INTO postings VALUES (?, ?, ?)", (field, gram, docs.tobytes()))
+        self.connection.commit()
+        self.connection.execute("VACUUM")
+
+    def _postings(self, field, gram):
+        blobs = [np.frombuffer(row[0], dtype=np.uint32) for row in self.connection.execute(
+            "SELECT docs FROM postings WHERE field = ? AND gram = ?", (field, gram))]
+        if not blobs:
+            return np.zeros(0, dtype=np.uint32)
+        return np.sort(np.concatenate(blobs)) if len(blobs) > 1 else blobs[0]
+
+    def _all(self):
+        return np.array([row[0] for row in self.connection.execute("SELECT doc_id FROM documents ORDER BY doc_id")],
+                        dtype=np.uint32)
+
+    def candidates(self, phrase, field="body"):
+        """
+        Returns the doc_ids of all documents that contain every bigram of a phrase
+
+        Parameters
+        ----------
+        phrase : Str
+            Phrase to look up. A phrase of one character has no bigrams, so every document
+            is a candidate.
+        field : Str
+            "title" or "body".
+
+        Returns
+        -------
+        doc_ids : Numpy Array
+            Sorted doc_ids, a superset of the documents that contain the phrase.
+
+        """
+        grams = bigrams(phrase)
+        if not grams:
+            return self._all()
+        # intersect the shortest lists first
+        postings = sorted((self._postings(field, gram) for gram in grams), key=len)
+        doc_ids = postings[0]
+        for docs in postings[1:]:
+            if not len(doc_ids):
+                break
+            doc_ids = np.intersect1d(doc_ids, docs, assume_unique=True)
+        return doc_ids
+
+    def containing(self, chars, field="body"):
+        """
+        Returns the doc_ids of all documents in which any of chars is followed by another
+        character (e.g. "《〈" for the documents that can refer to a title)
+        """
+        postings = []
+        for char in chars:
+            # all bigrams that start with char
+            rows = self.connection.execute("SELECT docs FROM postings WHERE field = ? AND gram >= ? AND gram < ?",
+                                           (field, char, chr(ord(char) + 1)))
+            postings += [np.frombuffer(row[0], dtype=np.uint32) for row in rows]
+        if not postings:
+            return np.zeros(0, dtype=np.uint32)
+        return np.unique(np.concatenate(postings))
+
+    def iter_documents(self, doc_ids=None, order="doc_id", size=chunk_size):
+        """
+        Reads documents from the index in chunks
+
+        Parameters
+        ----------
+        doc_ids : Iterable or NoneType
+            Documents to read, or all if None.
+        order : Str
+            "doc_id" or "date" (by publishing date, then doc_id).
+        size : Int
+            Number of documents per chunk.
+
+        Yields
+        ------
+        chunk : Pandas DataFrame
+            Columns doc_id, Link, Year, Database, Publishing date, Title and Body.
+
+        """
+        columns = ["doc_id", "Link", "Year", "Database", "Publishing date", "Title", "Body"]
+        if doc_ids is not None and order != "date":
+            doc_ids = sorted(int(doc_id) for doc_id in doc_ids)
+        else:
+            # the order comes from the table, keep only the requested documents
+            wanted = None if doc_ids is None else {int(doc_id) for doc_id in doc_ids}
+            sort = "date, doc_id" if order == "date" else "doc_id"
+            doc_ids = [row[0] for row in self.connection.execute(f"SELECT doc_id FROM documents ORDER BY {sort}")
+                       if wanted is None or row[0] in wanted]
+        for start in range(0, len(doc_ids), size):
+            chunk = doc_ids[start:start + size]
+            rows = self.connection.execute(
+                "SELECT doc_id, link, year, database, date, title, body FROM documents "
+                f"WHERE doc_id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            rows = {row[0]: row[:5] + tuple(zlib.decompress(text).decode("utf-8") for text in row[5:])
+                    for row in rows}
+            yield pd.DataFrame([rows[doc_id] for doc_id in chunk], columns=columns)
+
+    def iter_batches(self, doc_ids=None, size=chunk_size):
+        """
+        Yields the bodies that can refer to a title (those with a 《 or 〈) as batches for
+        reference_extractor.extract_references, in order of publishing date
+
+        Parameters
+        ----------
+        doc_ids : Iterable or NoneType
+            Documents to read (e.g. doc_ids() of the links of a dataset), or all if None.
+        size : Int
+            Number of documents per batch.
+
+        Yields
+        ------
+        List
+            (body, publishing date, link) per document of one batch.
+
+        """
+        candidates = self.containing("《〈")
+        if doc_ids is not None:
+            candidates = np.intersect1d(candidates, np.asarray(doc_ids, dtype=np.uint32))
+        for chunk in self.iter_documents(candidates, order="date", size=size):
+            yield list(zip(chunk["Body"], chunk["Publishing date"], chunk["Link"]))
+
+    def count(self, phrase, field="body"):
+        """
+        Counts a phrase in every document that contains it
+
+        Parameters
+        ----------
+        phrase : Str
+            Phrase to look up.
+        field : Str
+            "title" or "body".
+
+        Returns
+        -------
+        found : Pandas DataFrame
+            Columns Link, Year, Database and count (occurrences as str.count, i.e. not
+            overlapping), one row per document that contains the phrase.
+
+        """
+        found = []
+        column = fields[field]
+        for chunk in self.iter_documents(self.candidates(phrase, field)):
+            chunk["count"] = [text.count(phrase) for text in chunk[column]]
+            found.append(chunk.loc[chunk["count"] > 0, ["Link", "Year", "Database", "count"]])
+        if not found:
+            return pd.DataFrame(columns=["Link", "Year", "Database", "count"])
+        return pd.concat(found, ignore_index=True)
+
+    def find(self, phrase, field="body"):
+        """
+        Looks up all documents that contain a phrase
+
+        Parameters
+        ----------
+        phrase : Str
+            Phrase to look up.
+        field : Str
+            "title" or "body".
+
+        Returns
+        -------
+        found : Pandas DataFrame
+            Columns Link, Year and Database, in order of insertion.
+
+        """
+        return self.count(phrase, field)[["Link", "Year", "Database"]]
+
+    def referring(self, title):
+        """
+        Looks up all documents that refer to a title (as 《title》 or 〈title〉)
+        """
+        found = [self.find(left + title + right) for left, right in ["《》", "〈〉", "《〉", "〈》"]]
+        return pd.concat(found).drop_duplicates("Link").reset_index(drop=True)
+
+    def documents_per_year(self):
+        """
+        Returns the number of indexed documents per year
+        """
+        rows = self.connection.execute("SELECT year, COUNT(*) FROM documents WHERE year IS NOT NULL "
+                                       "GROUP BY year ORDER BY year").fetchall()
+        return pd.Series(dict(rows), name="documents", dtype=np.int64)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Per-host token bucket rate limiter with adaptive backoff. When a host answers with a code
+that usually means rate limiting or scraper detection, its rate is halved; every other answer
+raises the rate again step by step. Counters per host show which websites throttle us.
+Processes share one RateLimiter through a LimiterManager, so the rate of a host does not grow
+with the number of processes.
+"""
+
+import asyncio
+import threading
+import time
+from collections import Counter
+from multiprocessing.managers import BaseManager
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+# requests per second per host to start with
+initial_rate = 2.0
+# limits for the adaptive rate
+min_rate = 0.2
+max_rate = 10.0
+# number of requests that may be sent at once before the rate applies
+burst = 4
+# factor for the rate after a throttled answer
+backoff = 0.5
+# requests per second added after every other answer
+recovery = 0.1
+# answers that count as throttling
+throttle_codes = ["403", "412", "420", "429", "521"]
+# times to try a url again after a throttled answer (at the lowered rate of its host)
+max_retries = 1
+
+
+class HostLimiter():
+    def __init__(self):
+        """
+        Token bucket for a single host
+        """
+        self.rate = initial_rate
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self.statuses = Counter()
+
+    def take(self):
+        """
+        Takes a token if there is one
+
+        Returns
+        -------
+        Float
+            0 if a token was taken and the request may be sent, else the number of seconds
+            until the next token at the current rate.
+
+        """
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.requests += 1
+            return 0.0
+        wait = (1 - self.tokens) / self.rate
+        self.waited += wait
+        return wait
+
+    def update(self, result):
+        """
+        Adjusts the rate to the result of a request
+        """
+        self.statuses[str(result)] += 1
+        if str(result) in throttle_codes:
+            self.throttled += 1
+            self.rate = max(min_rate, self.rate * backoff)
+        else:
+            self.rate = min(max_rate, self.rate + recovery)
+
+
+class RateLimiter():
+    def __init__(self):
+        """
+        Keeps a token bucket per host. Use acquire() from asyncio code and wait() from
+        threads or plain loops.
+        """
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, url):
+        name = urlsplit(str(url)).netloc
+        with self.lock:
+            if name not in self.hosts:
+                self.hosts[name] = HostLimiter()
+            return self.hosts[name]
+
+    async def acquire(self, url):
+        """
+        Waits (without blocking the event loop) until a request to this url's host may be sent
+        """
+        host = self.host(url)
+        while True:
+            with self.lock:
+                wait = host.take()
+            if not wait:
+                return
+            # check again after waiting, the rate may have changed in the meantime
+            await asyncio.sleep(wait)
+
+    def wait(self, url):
+        """
+        Sleeps until a request to this url's host may be sent
+        """
+        host = self.host(url)
+        while True:
+            with self.lock:
+                wait = host.take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def update(self, url, result):
+        """
+        Reports the result of a request to this url's host
+        """
+        host = self.host(url)
+        with self.lock:
+            host.update(result)
+
+    def counters(self):
+        """
+        Returns the counters per host
+
+        Returns
+        -------
+        Pandas DataFrame
+            Per host: number of requests, number of throttled answers, seconds spent waiting,
+            the current rate and the number of answers per status code.
+
+        """
+        rows = []
+        for name, host in self.hosts.items():
+            row = {"host": name, "requests": host.requests, "throttled": host.throttled,
+                   "seconds_waited": round(host.waited, 1), "rate": round(host.rate, 2)}
+            row.update(host.statuses)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+class LimiterManager(BaseManager):
+    """
+    Server process for a RateLimiter that is shared by several processes. Start it with
+    "with LimiterManager() as manager:", create the limiter with manager.RateLimiter() and pass
+    it to the processes (e.g. as initargs), every call then goes to the same token buckets.
+    """
+
+
+LimiterManager.register("RateLimiter", RateLimiter)
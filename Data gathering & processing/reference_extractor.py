@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Single-pass extraction of referred titles (《...》) from document bodies. Bodies are read in
+row batches, and each title is kept with the first document that refers to it.
+"""
+
+import re
+import pandas as pd
+import progressbar as pb
+
+import metrics
+import scheduler
+
+# regex for referred-titles
+# note: this also extracts self-references and references to e.g., attachments
+title_pattern = re.compile("[《〈][^》]{7,60}[》〉]")
+
+# number of documents per batch
+batch_size = 2000
+# max number of batches handed to the processes at once, so a stream of batches (e.g. from
+# ngram_index.py) is not read into memory faster than it is processed, None for twice the
+# number of processes
+max_pending = None
+
+
+def iter_batches(df, size=batch_size):
+    """
+    Splits a dataset into row batches
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        Contains the columns "Body", "Publishing date" and "Link".
+    size : Int
+        Number of rows per batch.
+
+    Yields
+    ------
+    List
+        (body, publishing date, link) per document of one batch.
+
+    """
+    for start in range(0, len(df), size):
+        batch = df.iloc[start:start + size]
+        yield list(zip(batch["Body"], batch["Publishing date"], batch["Link"]))
+
+
+def extract_batch(batch):
+    """
+    Extracts all referred titles from one batch, keeping the first referral of each title
+
+    Parameters
+    ----------
+    batch : List
+        (body, publishing date, link) per document.
+
+    Returns
+    -------
+    found : Dict
+        Title -> (referral_date, referred_in), in order of first appearance.
+
+    """
+    found = {}
+    for body, date, link in batch:
+        for string in title_pattern.findall(str(body)):
+            title = string[1:-1]
+            if title not in found:
+                found[title] = (date, link)
+    return found
+
+
+def _extract_sized(batch):
+    return len(batch), extract_batch(batch)
+
+
+def extract_references(batches, num_processes=1, total=None):
+    """
+    Extracts all referred titles from a stream of batches. Batches are merged in input order,
+    so the result does not depend on the number of processes, and read from the stream only
+    as the processes are ready for them (see max_pending).
+
+    Parameters
+    ----------
+    batches : Iterable
+        Batches as yielded by iter_batches().
+    num_processes : Int
+        Number of processes to extract with.
+    total : Int or NoneType
+        Number of documents, to show a progressbar.
+
+    Returns
+    -------
+    data : Pandas DataFrame
+        Contains all extracted titles with their information.
+
+    """
+    with metrics.stage("parse_referred_titles") as info:
+        seen = {}
+        if total:
+            widgets = [f' Parsing {str(total)} documents', pb.Percentage(), ' ',pb.Bar(marker=pb.RotatingMarker()), ' ', pb.ETA()]
+            timer = pb.ProgressBar(widgets=widgets, maxval=total).start()
+
+        # the batches come back in input order, so the first referral stays the same; only
+        # max_pending batches are read ahead of the processes
+        if num_processes > 1:
+            results = scheduler.stream(_extract_sized, batches, num_processes, max_pending=max_pending,
+                                       stage="parse_referred_titles")
+        else:
+            results = (scheduler.run_batch(_extract_sized, "parse_referred_titles", batch) for batch in batches)
+        done = 0
+        for size, found in results:
+            for title, referral in found.items():
+                if title not in seen:
+                    seen[title] = referral
+            done += size
+            if total:
+                timer.update(min(done, total))
+        if total:
+            timer.finish()
+        info["items"] = done
+
+    return pd.DataFrame({"title": list(seen),
+                         "referral_date": [referral[0] for referral in seen.values()],
+                         "referred_in": [referral[1] for referral in seen.values()]})
+
+
+def parse_referred_titles(df, num_processes=1):
+    """
+    Extracts all referenced titles from a dataset
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        Contains all documents to be extracted from.
+    num_processes : Int
+        Number of processes to extract with.
+
+    Returns
+    -------
+    data : Pandas DataFrame
+        Contains all extracted titles with their information.
+
+    """
+    return extract_references(iter_batches(df), num_processes, total=len(df))
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only SQLite store for the results of CheckDeletion.py and CheckGeoblocking.py.
+Results are keyed by check round and url and written in batches, so a crashed run can be
+restarted and will skip every url that already has a result. The store also keeps the
+ETag/Last-Modified validators of checked pages with their result, so a later run can request
+them conditionally.
+"""
+
+import json
+import sqlite3
+
+
+class ResultStore():
+    def __init__(self, path, batch_size=50):
+        """
+        Opens (or creates) a result store. Every process should open its own ResultStore.
+
+        Parameters
+        ----------
+        path : Str
+            Path of the SQLite file.
+        batch_size : Int
+            Number of results to collect before writing them to disk.
+
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.pending_validators = []
+        # multiple processes write to the same file, wait for each other's locks
+        self.connection = sqlite3.connect(path, timeout=300)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                                   round INTEGER NOT NULL,
+                                   url TEXT NOT NULL,
+                                   result TEXT,
+                                   PRIMARY KEY (round, url))""")
+        # validators are kept when the results are cleared for a new run
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS validators (
+                                   url TEXT PRIMARY KEY,
+                                   etag TEXT,
+                                   last_modified TEXT,
+                                   result TEXT)""")
+        self.connection.commit()
+
+    def add(self, round_, url, result):
+        """
+        Adds a result, written to disk once batch_size results have been collected
+
+        Parameters
+        ----------
+        round_ : Int
+            Number of the check round.
+        url : Str
+            Url that has been checked.
+        result : Var
+            Result of the check, anything that can be saved as JSON.
+
+        """
+        self.pending.append((round_, str(url), json.dumps(result, ensure_ascii=False)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def add_validator(self, url, etag, last_modified, result):
+        """
+        Saves the validators a page was served with, together with the result they stand for
+
+        Parameters
+        ----------
+        url : Str
+            Url that has been checked.
+        etag : Str or NoneType
+            ETag header of the page.
+        last_modified : Str or NoneType
+            Last-Modified header of the page.
+        result : Var
+            Result of the check, given again when the page has not been modified.
+
+        """
+        self.pending_validators.append((str(url), etag, last_modified, json.dumps(result, ensure_ascii=False)))
+        if len(self.pending_validators) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all collected results to disk
+        """
+        if self.pending or self.pending_validators:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", self.pending)
+                self.connection.executemany("INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?)",
+                                            self.pending_validators)
+            self.pending = []
+            self.pending_validators = []
+
+    def done(self, round_):
+        """
+        Returns the set of urls that already have a result for a round
+        """
+        cursor = self.connection.execute("SELECT url FROM results WHERE round = ?", (round_,))
+        return {row[0] for row in cursor} | {p[1] for p in self.pending if p[0] == round_}
+
+    def results(self, round_):
+        """
+        Returns a dict of url -> result for a round
+        """
+        self.flush()
+        cursor = self.connection.execute("SELECT url, result FROM results WHERE round = ?", (round_,))
+        return {url: json.loads(result) for url, result in cursor}
+
+    def validators(self):
+        """
+        Returns a dict of url -> (etag, last_modified, result) of the pages saved with
+        add_validator
+        """
+        self.flush()
+        cursor = self.connection.execute("SELECT url, etag, last_modified, result FROM validators")
+        return {url: (etag, last_modified, json.loads(result)) for url, etag, last_modified, result in cursor}
+
+    def clear(self):
+        """
+        Deletes the results of all rounds to check every url again, keeping the validators
+        """
+        self.flush()
+        with self.connection:
+            self.connection.execute("DELETE FROM results")
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Shared job-queue scheduler for the multiprocessing pipelines. Work is cut into small batches
+on one queue, and each process takes the next batch as soon as it is done with its last one,
+so a slow batch (e.g. a government site that times out for every url) no longer leaves the
+other processes idle. Results are merged back in input order. Every batch is timed in its
+process, and the queue depth is sampled as results come in (see metrics.py).
+"""
+
+import time
+from collections import deque
+from functools import partial
+from multiprocessing import Pool
+
+import metrics
+
+
+def make_batches(items, batch_size):
+    """
+    Splits a list into batches of batch_size items
+    """
+    return [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+
+def run_batch(func, stage, batch):
+    """
+    Runs func over one batch and records the time it took in this process
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    results = func(batch)
+    metrics.batch(stage, len(batch), time.perf_counter() - wall, time.process_time() - cpu)
+    return results
+
+
+def run(func, items, num_processes, batch_size, initializer=None, initargs=(), stage=None):
+    """
+    Runs func over all items in batches, spread over num_processes processes
+
+    Parameters
+    ----------
+    func : Function
+        Module-level function that takes a list of items and returns a list with one result
+        per item.
+    items : List
+        All items to process.
+    num_processes : Int
+        Number of processes.
+    batch_size : Int
+        Number of items per batch. Smaller batches spread the work more evenly.
+    initializer : Function or NoneType
+        Called once in every process before its first batch, e.g. to start a webdriver.
+    initargs : Tuple
+        Arguments for initializer.
+    stage : Str or NoneType
+        Name of the stage in the metrics, defaults to the name of func.
+
+    Returns
+    -------
+    results : List
+        One result per item, in the same order as items.
+
+    """
+    stage = stage or func.__name__
+    items = list(items)
+    results = []
+    pool = Pool(num_processes, initializer, initargs)
+    try:
+        # imap hands out one batch at a time and yields the results in input order
+        for batch_results in pool.imap(partial(run_batch, func, stage), make_batches(items, batch_size)):
+            results.extend(batch_results)
+            metrics.queue_depth(stage, len(items) - len(results))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+def stream(func, chunks, num_processes, initializer=None, initargs=(), max_pending=None, stage=None):
+    """
+    Runs func over chunks that are produced one at a time (e.g. read from a large file),
+    keeping at most max_pending chunks in memory. Unlike Pool.imap, which reads its whole
+    input as fast as it can, the next chunk is only read once a result has been taken.
+
+    Parameters
+    ----------
+    func : Function
+        Module-level function that takes a chunk.
+    chunks : Iterable
+        Chunks to process, read lazily.
+    num_processes : Int
+        Number of processes.
+    initializer : Function or NoneType
+        Called once in every process before its first chunk.
+    initargs : Tuple
+        Arguments for initializer.
+    max_pending : Int or NoneType
+        Max number of chunks sent out at once, defaults to twice num_processes.
+    stage : Str or NoneType
+        Name of the stage in the metrics, defaults to the name of func.
+
+    Yields
+    ------
+    result
+        func(chunk) for every chunk, in the same order as chunks.
+
+    """
+    max_pending = max_pending or 2 * num_processes
+    stage = stage or func.__name__
+    pending = deque()
+    pool = Pool(num_processes, initializer, initargs)
+    try:
+        for chunk in chunks:
+            pending.append(pool.apply_async(run_batch, (func, stage, chunk)))
+            if len(pending) >= max_pending:
+                metrics.queue_depth(stage, len(pending))
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
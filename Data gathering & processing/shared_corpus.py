@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Publishes the title index (title_clean, doc_type, Year and Link columns plus the lookup
+arrays) once in a shared memory block. Worker processes attach to the block and read
+the arrays in place, so memory stays flat however many processes are started.
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+
+from title_index import TitleIndex, layout
+
+
+def publish(index):
+    """
+    Copies all arrays of an index into one new shared memory block
+
+    Parameters
+    ----------
+    index : TitleIndex
+        Index built in the main process.
+
+    Returns
+    -------
+    shm : SharedMemory
+        The shared memory block. Keep it open until all workers are done, then call
+        shm.close() and shm.unlink().
+    handle : Dict
+        Small picklable description of the block, to pass to the workers.
+
+    """
+    placed, size = layout(index.arrays)
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for name, array in index.arrays.items():
+        dtype, shape, offset = placed[name]
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+
+    handle = {"name": shm.name, "layout": placed, "doc_types": index.doc_types, "databases": index.databases}
+    return shm, handle
+
+
+def attach(handle):
+    """
+    Attaches to a published index without copying it
+
+    Parameters
+    ----------
+    handle : Dict
+        Handle returned by publish().
+
+    Returns
+    -------
+    index : TitleIndex
+        Index reading straight from the shared memory block.
+
+    """
+    shm = shared_memory.SharedMemory(name=handle["name"])
+    arrays = {}
+    for name, (dtype, shape, offset) in handle["layout"].items():
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+    index = TitleIndex.from_arrays(arrays, handle["doc_types"], handle["databases"])
+    # keep the block open for as long as the index is in use
+    index.shm = shm
+    return index
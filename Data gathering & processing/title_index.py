@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+Prebuilt matching index for CrossReference. Replaces the row-by-row scan over the full
+dataset with a hash map for exact title hits and a suffix array for non-exact hits.
+
+All data is kept in flat numpy arrays (see TitleIndex.arrays): the titles and links in one
+buffer each with an offsets array, doc_type and Database as categorical codes and Year as
+ints. The index can be pickled compactly, published once in shared memory (see
+shared_corpus.py), or saved to one file that is memory-mapped when loaded.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from bisect import bisect_left, bisect_right
+from hashlib import blake2b
+
+# document types that only count as released when the title matches exactly
+excluded_doc_types = ["新闻", "解读"]
+# byte alignment of each array within a saved index or shared memory block
+alignment = 64
+
+
+def build_suffix_array(codes):
+    """
+    Builds a suffix array through prefix doubling
+
+    Parameters
+    ----------
+    codes : Numpy array
+        Integer codes of the text. Title separators should have unique codes so that no
+        common prefix runs across two titles.
+
+    Returns
+    -------
+    sa : Numpy array
+        Start positions of all suffixes, in sorted order.
+
+    """
+    n = len(codes)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    rank = np.unique(codes, return_inverse=True)[1].astype(np.int64).ravel()
+    k = 1
+    while True:
+        # sort on (rank of first k chars, rank of next k chars)
+        second = np.full(n, -1, dtype=np.int64)
+        second[:n - k] = rank[k:]
+        sa = np.lexsort((second, rank))
+        r = rank[sa]
+        s = second[sa]
+        new_group = np.empty(n, dtype=bool)
+        new_group[0] = True
+        new_group[1:] = (r[1:] != r[:-1]) | (s[1:] != s[:-1])
+        new_rank = np.cumsum(new_group) - 1
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa] = new_rank
+        if new_rank[-1] == n - 1 or k >= n:
+            return sa
+        k *= 2
+
+
+def layout(arrays, start=0):
+    """
+    Places arrays one after the other in a single buffer
+
+    Parameters
+    ----------
+    arrays : Dict
+        Name -> numpy array.
+    start : Int
+        Offset of the first array.
+
+    Returns
+    -------
+    layout : Dict
+        Name -> (dtype, shape, offset), every offset aligned to alignment bytes.
+    size : Int
+        Size of the buffer.
+
+    """
+    placed = {}
+    size = start
+    for name, array in arrays.items():
+        size = -(-size // alignment) * alignment
+        placed[name] = (array.dtype.str, array.shape, size)
+        size += array.nbytes
+    return placed, size
+
+
+def corpus_key(full_data):
+    """
+    Hash over the columns a TitleIndex is built from, to tell whether a saved index is
+    still up to date
+    """
+    columns = [c for c in ["title_clean", "doc_type", "Year", "Link", "Database"] if c in full_data]
+    hashes = pd.util.hash_pandas_object(full_data[columns], index=False).to_numpy()
+    return blake2b(hashes.tobytes() + json.dumps(columns).encode(), digest_size=16).hexdigest()
+
+
+def title_hash(title):
+    """
+    Stable 64-bit hash of a title (the built-in hash() differs between processes)
+    """
+    return int.from_bytes(blake2b(title.encode("utf-32-be"), digest_size=8).digest(), "big")
+
+
+class TitleIndex():
+    def __init__(self, full_data):
+        """
+        Indexes the cleaned titles of all published documents. Lookups return the same first
+        match as scanning full_data row by row.
+
+        Parameters
+        ----------
+        full_data : Pandas DataFrame
+            Contains all published documents you want to check against, with the columns
+            "title_clean", "doc_type", "Year" and "Link", and optionally "Database".
+
+        """
+        titles = full_data["title_clean"].tolist()
+        n = len(titles)
+
+        # title column: one text of all titles, each followed by a "\x00" separator,
+        # stored as big-endian UTF-32 so byte order equals character order
+        parts = [str(t) for t in titles]
+        text = np.frombuffer(("\x00".join(parts) + "\x00").encode("utf-32-be"), dtype=">u4")
+        lengths = np.array([len(p) for p in parts], dtype=np.int64)
+        starts = np.zeros(n, dtype=np.int64)
+        starts[1:] = np.cumsum(lengths + 1)[:-1]
+        position_rows = np.repeat(np.arange(n, dtype=np.int32), lengths + 1)
+
+        # suffix array: separators get unique codes below any character so suffixes
+        # never compare beyond the end of their own title
+        codes = text.astype(np.int64)
+        codes[starts + lengths] = -1 - np.arange(n)
+        sa = build_suffix_array(codes).astype(np.int64)
+
+        # exact matches: hash map from title to rows, kept as arrays sorted on (hash, row)
+        str_rows = np.array([k for k in range(n) if isinstance(titles[k], str)], dtype=np.int32)
+        hashes = np.array([title_hash(titles[k]) for k in str_rows], dtype=np.uint64)
+        order = np.lexsort((str_rows, hashes))
+
+        # doc_type as categorical codes
+        doc_type_codes, doc_types = _factorize(full_data["doc_type"].tolist())
+        databases = full_data["Database"].tolist() if "Database" in full_data else [None] * n
+        database_codes, databases = _factorize(databases)
+
+        # Link column: utf-8 bytes plus offsets
+        links = [str(l).encode("utf-8") for l in full_data["Link"].tolist()]
+        link_offsets = np.zeros(n + 1, dtype=np.int64)
+        link_offsets[1:] = np.cumsum([len(l) for l in links])
+        link_data = np.frombuffer(b"".join(links), dtype=np.uint8)
+
+        arrays = {"text": text, "starts": starts, "lengths": lengths,
+                  "position_rows": position_rows, "sa": sa,
+                  "exact_hashes": hashes[order], "exact_rows": str_rows[order],
+                  "doc_type_codes": doc_type_codes, "database_codes": database_codes,
+                  "years": full_data["Year"].astype(np.int64).to_numpy(),
+                  "link_data": link_data, "link_offsets": link_offsets}
+        self._load(arrays, doc_types, databases)
+
+    @classmethod
+    def from_arrays(cls, arrays, doc_types, databases):
+        """
+        Creates an index from arrays built earlier, without copying them
+
+        Parameters
+        ----------
+        arrays : Dict
+            Arrays as found in TitleIndex.arrays.
+        doc_types : List
+            Categories belonging to the doc_type codes.
+        databases : List
+            Categories belonging to the database codes.
+
+        Returns
+        -------
+        TitleIndex
+
+        """
+        index = cls.__new__(cls)
+        index._load(arrays, doc_types, databases)
+        return index
+
+    def save(self, path, key=None):
+        """
+        Saves the index to one file: a JSON header followed by all arrays
+
+        Parameters
+        ----------
+        path : Str
+            File to write.
+        key : Str or NoneType
+            Saved with the index, e.g. corpus_key() of the data it was built from.
+
+        """
+        placed, size = layout(self.arrays)
+        header = {"doc_types": self.doc_types, "databases": self.databases, "key": key, "layout": placed}
+        encoded = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        # array offsets count from the first aligned byte after the header
+        start = -(-(8 + len(encoded)) // alignment) * alignment
+        with open(path, "wb") as file:
+            file.write(len(encoded).to_bytes(8, "little"))
+            file.write(encoded)
+            for name, array in self.arrays.items():
+                file.seek(start + placed[name][2])
+                file.write(np.ascontiguousarray(array).tobytes())
+            file.truncate(start + size)
+
+    @staticmethod
+    def read_header(path):
+        """
+        Returns the header of a saved index and the position of its first array
+        """
+        with open(path, "rb") as file:
+            length = int.from_bytes(file.read(8), "little")
+            header = json.loads(file.read(length).decode("utf-8"))
+        return header, -(-(8 + length) // alignment) * alignment
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a saved index. The arrays are memory-mapped, so loading takes about as long as
+        reading the header, and processes that load the same file share its pages.
+
+        Parameters
+        ----------
+        path : Str
+            File written by save().
+
+        Returns
+        -------
+        TitleIndex
+
+        """
+        header, start = cls.read_header(path)
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        arrays = {}
+        for name, (dtype, shape, offset) in header["layout"].items():
+            arrays[name] = np.ndarray(tuple(shape), dtype=dtype, buffer=buffer, offset=start + offset)
+        return cls.from_arrays(arrays, header["doc_types"], header["databases"])
+
+    @classmethod
+    def cached(cls, full_data, path):
+        """
+        Loads the index saved at path if it was built from the same data, else builds the
+        index and saves it there
+        """
+        key = corpus_key(full_data)
+        try:
+            if cls.read_header(path)[0]["key"] == key:
+                return cls.load(path)
+        except (OSError, ValueError):
+            pass
+        index = cls(full_data)
+        index.save(path, key)
+        return index
+
+    def _load(self, arrays, doc_types, databases):
+        self.arrays = arrays
+        self.doc_types = doc_types
+        self.databases = databases
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        excluded = [c for c in range(len(doc_types)) if doc_types[c] in excluded_doc_types]
+        self.eligible = ~np.isin(self.doc_type_codes, excluded)
+
+    def title(self, k):
+        start = self.starts[k]
+        return self.text[start:start + self.lengths[k]].tobytes().decode("utf-32-be")
+
+    def link(self, k):
+        return self.link_data[self.link_offsets[k]:self.link_offsets[k + 1]].tobytes().decode("utf-8")
+
+    def doc_type(self, k):
+        return self.doc_types[self.doc_type_codes[k]]
+
+    def database(self, k):
+        return self.databases[self.database_codes[k]]
+
+    def find(self, t):
+        """
+        Checks a title against the index to see if it exists
+
+        Parameters
+        ----------
+        t : String
+            Title to check.
+
+        Returns
+        -------
+        bool
+            True if document has been published, else False.
+        Int or NoneType
+            The year a document was published, or NoneType if not published.
+        String or NoneType
+            The url of the published document, or NoneType if not published.
+
+        """
+        # an empty index still holds one separator, which belongs to no row
+        if not len(self.starts):
+            return False, None, None
+        candidates = []
+
+        # check exact match of title
+        h = np.uint64(title_hash(t))
+        lo = np.searchsorted(self.exact_hashes, h, side="left")
+        hi = np.searchsorted(self.exact_hashes, h, side="right")
+        for k in self.exact_rows[lo:hi]:
+            if self.title(k) == t:
+                candidates.append(int(k))
+                break
+
+        # check non-exact match of title: binary search for the block of suffixes starting with t
+        m = len(t)
+        encoded = t.encode("utf-32-be")
+        key = lambda p: self.text[p:p + m].tobytes()
+        lo = bisect_left(self.sa, encoded, key=key)
+        hi = bisect_right(self.sa, encoded, lo=lo, key=key)
+        if hi > lo:
+            rows = self.position_rows[self.sa[lo:hi]]
+            rows = rows[self.eligible[rows]]
+            if len(rows):
+                candidates.append(int(rows.min()))
+
+        if candidates:
+            k = min(candidates)
+            return True, int(self.years[k]), self.link(k)
+        return False, None, None
+
+
+def _factorize(values):
+    """
+    Turns a list of values into int32 codes and the list of unique values
+    """
+    categories = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for k, value in enumerate(values):
+        codes[k] = categories.setdefault(value, len(categories))
+    return codes, list(categories)
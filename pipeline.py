@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Command line entry point for the pipelines and the figures:
+
+    python pipeline.py crossref [--incremental] [--ngram-index] [--processes N]
+    python pipeline.py check-deletion [--round {1,2}] [--recheck] [--processes N]
+    python pipeline.py check-geoblock [--processes N]
+    python pipeline.py figures [Fig_1 ...] [--force] [--processes N]
+
+Every subcommand imports only the script it runs, so e.g. round 1 of the deletion check does
+not load selenium and the cross-referencing does not load matplotlib. The scripts read and
+write files relative to their own folder, so each one is run from there, as before. The
+crossref and check-deletion runs record their metrics (metrics.py) next to their outputs.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+data_folder = os.path.join(here, "Data gathering & processing")
+analysis_folder = os.path.join(here, "Analysis")
+
+
+def load(folder, name):
+    """
+    Changes to the folder of a script and imports it, worker processes inherit both
+    """
+    os.chdir(folder)
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+    return importlib.import_module(name)
+
+
+def crossref(args):
+    script = load(data_folder, "CreateCrossReferencedDataset")
+    if args.processes:
+        script.num_processes = args.processes
+    script.incremental = args.incremental
+    script.use_ngram_index = args.ngram_index
+    script.main()
+
+
+def check_deletion(args):
+    script = load(data_folder, "CheckDeletion")
+    if args.processes:
+        script.num_processes = args.processes
+    script.recheck = args.recheck
+    script.main((args.round,) if args.round else (1, 2))
+
+
+def check_geoblock(args):
+    script = load(data_folder, "CheckGeoblocking")
+    if args.processes:
+        script.num_processes = args.processes
+    script.main()
+
+
+def figures(args):
+    script = load(analysis_folder, "build_figures")
+    script.build(args.names or None, args.force, args.processes or script.num_processes)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the steps of the policy transparency pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_crossref = subparsers.add_parser("crossref", help="cross-reference the titles referred to in data.xlsx")
+    parser_crossref.add_argument("--processes", type=int, help="number of processes (num_processes)")
+    parser_crossref.add_argument("--incremental", action="store_true",
+                                 help="only process documents added since the last run")
+    parser_crossref.add_argument("--ngram-index", action="store_true",
+                                 help="extract the references from the bigram index")
+    parser_crossref.set_defaults(func=crossref)
+
+    parser_deletion = subparsers.add_parser("check-deletion", help="check whether sampled documents were removed")
+    parser_deletion.add_argument("--round", type=int, choices=[1, 2],
+                                 help="run only this round (default: both), round 2 continues from stored round 1 results")
+    parser_deletion.add_argument("--recheck", action="store_true",
+                                 help="check the whole sample again, with conditional requests for unchanged pages")
+    parser_deletion.add_argument("--processes", type=int, help="number of processes or browsers (num_processes)")
+    parser_deletion.set_defaults(func=check_deletion)
+
+    parser_geoblock = subparsers.add_parser("check-geoblock", help="check website availability per server location")
+    parser_geoblock.add_argument("--processes", type=int, help="number of processes (num_processes)")
+    parser_geoblock.set_defaults(func=check_geoblock)
+
+    parser_figures = subparsers.add_parser("figures", help="render the figures whose inputs have changed")
+    parser_figures.add_argument("names", nargs="*", help="figures to build (default: all), e.g. Fig_3")
+    parser_figures.add_argument("--force", action="store_true", help="render the figures even if they are up to date")
+    parser_figures.add_argument("--processes", type=int, help="number of processes (num_processes)")
+    parser_figures.set_defaults(func=figures)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.func(args)